@@ -1,118 +1,2335 @@
+import time
+SCRIPT_START = time.perf_counter()   # 첫 화면까지 걸린 시간(import 포함) 측정용
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from datetime import datetime
+import numpy as np
+from datetime import datetime, timedelta
 import calendar
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import time
+import codecs
+import io
 import os
+import sys
+import threading
+import collections
+import contextlib
+import json
+import logging
+import sqlite3
+import hashlib
+import uuid
 
 # --- 1. 설정 및 구글 시트 연결 ---
 
 JSON_FILE = 'family-ledger-486809-9594b880837a.json'
 SPREADSHEET_NAME = '가계부데이터' 
-HEADERS = ['날짜', '구분', '사용자', '카테고리', '내역', '금액']
-FIXED_HEADERS = ['일자', '구분', '사용자', '카테고리', '내역', '금액']
+HEADERS = ['날짜', '구분', '사용자', '카테고리', '내역', '금액', 'ID']
+FIXED_HEADERS = ['일자', '구분', '사용자', '카테고리', '내역', '금액', 'ID']
 
-COL_MAP = {'날짜': 1, '구분': 2, '사용자': 3, '카테고리': 4, '내역': 5, '금액': 6}
+COL_MAP = {'날짜': 1, '구분': 2, '사용자': 3, '카테고리': 4, '내역': 5, '금액': 6, 'ID': 7}
 
 INCOME_CATS = ["월급", "월세", "성과급", "부수입", "기타"]
 EXPENSE_CATS = ["외식/배달", "공과금", "식비", "쇼핑", "교통", "의료/건강", "임신/육아", "생필품", "여행", "취미", "축의/조의", "주거", "통신", "자동차", "미용", "용돈", "저축", "기타"]
-
-def get_client():
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+ALL_CATS = list(dict.fromkeys(EXPENSE_CATS + INCOME_CATS))
+TYPES = ["지출", "수입"]
+USERS = ["해기", "에디", "같이"]
+
+def get_config(name, default):
+    # 환경변수 > st.secrets > 기본값 순서로 설정을 읽는다
+    value = os.environ.get(name.upper())
+    if value is None:
+        try:
+            value = st.secrets.get(name, default)
+        except:
+            value = default
+    if isinstance(default, bool) and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
+
+CACHE_TTL = get_config("cache_ttl", 600)
+FULL_SYNC_INTERVAL = get_config("full_sync_interval", 3600)
+SYNC_TAIL_ROWS = get_config("sync_tail_rows", 20)
+PAGE_SIZE = get_config("page_size", 50)
+ANALYSIS_CACHE_SIZE = get_config("analysis_cache_size", 32)
+CHART_MAX_POINTS = get_config("chart_max_points", 120)
+WRITE_BEHIND = get_config("write_behind", False)
+WRITE_RETRIES = get_config("write_retries", 6)
+
+PERF_WINDOW = get_config("perf_window", 200)
+PERF_LOG = get_config("perf_log", False)
+PERF_PANEL = get_config("perf_panel", False)
+
+# --- 성능 측정 ---
+# timed(구간)으로 감싼 부분의 실행 시간을 재서
+#   - 이번 실행(rerun)의 구간별 시간, API 요청 수, 받은 바이트 수 (스레드별)
+#   - 프로세스 전체의 구간별 최근 PERF_WINDOW개 기록 (p50/p95 계산용)
+# 에 모은다. 실행이 끝나면 perf_log 설정에 따라 JSON 한 줄로 로그를 남긴다
+
+perf_logger = logging.getLogger("ledger.perf")
+if PERF_LOG and not perf_logger.handlers:
+    perf_logger.addHandler(logging.StreamHandler())
+    perf_logger.setLevel(logging.INFO)
+perf_local = threading.local()
+
+@st.cache_resource(show_spinner=False)
+def get_perf_stats():
+    return {"lock": threading.Lock(), "sections": collections.defaultdict(lambda: collections.deque(maxlen=PERF_WINDOW)),
+            "api_calls": 0, "bytes": 0}
+
+def perf_record(section, seconds):
+    run = getattr(perf_local, "run", None)
+    if run is not None:
+        run["sections"][section] = run["sections"].get(section, 0.0) + seconds
+    stats = get_perf_stats()
+    with stats["lock"]:
+        stats["sections"][section].append(seconds)
+
+def count_api(nbytes=0):
+    perf_local.api_calls = api_calls() + 1
+    run = getattr(perf_local, "run", None)
+    if run is not None:
+        run["api_calls"] += 1
+        run["bytes"] += nbytes
+    stats = get_perf_stats()
+    with stats["lock"]:
+        stats["api_calls"] += 1
+        stats["bytes"] += nbytes
+
+def api_calls():
+    # 이 스레드가 지금까지 보낸 API 요청 수. 저장 전후의 차이로 실제로 보낸 요청 수를 센다
+    return getattr(perf_local, "api_calls", 0)
+
+def perf_response_hook(response, *args, **kwargs):
+    # gspread가 쓰는 requests 세션의 응답마다 호출된다
+    count_api(len(response.content or b""))
+
+class timed(contextlib.ContextDecorator):
+    # with timed("구간"): 또는 @timed("구간") 으로 쓴다
+    def __init__(self, section):
+        self.section = section
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        perf_record(self.section, time.perf_counter() - self.start)
+        return False
+
+class perf_run(contextlib.ContextDecorator):
+    # 화면 한 번 실행(rerun) 전체를 잰다. main()과 화면 조각(fragment)마다 붙여서 쓴다
+    # 조각만 다시 실행될 때는 main()을 거치지 않으므로 조각 쪽에서 따로 잰다 (scope: "app" 또는 조각 이름)
+    # 전체 실행 안에서 조각이 그려질 때는 바깥(main) 실행에 합쳐서 센다
+    def __init__(self, scope="app"):
+        self.scope = scope
+
+    def __enter__(self):
+        perf_local.depth = getattr(perf_local, "depth", 0) + 1
+        if perf_local.depth == 1:
+            perf_local.run = {"sections": {}, "api_calls": 0, "bytes": 0, "start": time.perf_counter()}
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        perf_local.depth -= 1
+        if perf_local.depth: return False
+        run = perf_local.run
+        total = time.perf_counter() - run["start"]
+        perf_record("rerun" if self.scope == "app" else f"rerun:{self.scope}", total)
+        perf_local.run = None
+        perf_logger.info(json.dumps({
+            "event": "rerun", "scope": self.scope, "total_ms": round(total * 1000, 1), "api_calls": run["api_calls"], "bytes": run["bytes"],
+            "sections_ms": {k: round(v * 1000, 1) for k, v in run["sections"].items()},
+            "rerun": exc_type is not None and exc_type.__name__ == "RerunException",
+        }, ensure_ascii=False))
+        return False
+
+def mark_startup(event):
+    # 세션마다 한 번, 그 실행의 시작(SCRIPT_START, 프로세스를 막 띄운 경우 import 시간 포함)부터 걸린 시간을 기록한다
+    #   first_paint: 첫 화면(로그인 화면)을 다 그릴 때까지
+    #   first_data: 로그인한 실행에서 가계부를 처음 읽어 올 때까지 (비밀번호 입력 시간은 빠짐)
+    marks = st.session_state.setdefault("startup_marks", {})
+    if event in marks: return
+    marks[event] = time.perf_counter() - SCRIPT_START
+    perf_record(event, marks[event])
+    perf_logger.info(json.dumps({"event": event, "ms": round(marks[event] * 1000, 1)}))
+
+def perf_summary():
+    # 구간별 [구간, 이번 실행(ms), p50(ms), p95(ms), 기록 수]
+    run = getattr(perf_local, "run", None) or {"sections": {}}
+    stats = get_perf_stats()
+    with stats["lock"]:
+        samples = {k: list(v) for k, v in stats["sections"].items()}
+    rows = []
+    for section, values in sorted(samples.items()):
+        p50, p95 = np.percentile(values, [50, 95]) if values else (0, 0)
+        current = run["sections"].get(section)
+        rows.append([section, None if current is None else round(current * 1000, 1), round(p50 * 1000, 1), round(p95 * 1000, 1), len(values)])
+    return pd.DataFrame(rows, columns=["구간", "이번(ms)", "p50(ms)", "p95(ms)", "기록 수"])
+
+def perf_panel():
+    # 관리자용 사이드바 패널 (perf_panel 설정 또는 주소에 ?admin=1)
+    if not (PERF_PANEL or st.query_params.get("admin") == "1"): return
+    run = getattr(perf_local, "run", None)
+    with st.expander("🛠️ 성능 (관리자)"):
+        if run is not None:
+            elapsed = (time.perf_counter() - run["start"]) * 1000
+            st.caption(f"이번 실행: {elapsed:,.0f}ms · API {run['api_calls']}회 · {run['bytes'] / 1024:,.1f}KB")
+        stats = get_perf_stats()
+        st.caption(f"프로세스 누적: API {stats['api_calls']:,}회 · {stats['bytes'] / 1024 / 1024:,.2f}MB")
+        st.dataframe(perf_summary(), use_container_width=True, hide_index=True)
+
+SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+FIXED_SHEET = "고정지출"
+POSTING_SHEET = "고정지출기록"   # 고정 항목을 어느 달에 등록했는지 (항목 ID, 'YYYY-MM', 등록한 내역 ID, 등록 시각)
+POSTING_HEADERS = ['항목ID', '월', '내역ID', '등록시각']
+
+# 구글 시트 라이브러리(gspread, oauth2client)는 불러오는 데 0.5초쯤 걸려서 모듈 맨 위가 아니라 처음 쓰는 곳에서 불러온다
+# 로그인 화면이 떠 있는 동안 start_warm_up()이 백그라운드에서 미리 불러오고 인증/스프레드시트 열기까지 해 둔다
+
+def cell_a1(row, col):
+    # (행, 열) → "G12" (열은 26개를 넘지 않는다)
+    return f"{chr(64 + col)}{row}"
+
+def get_credentials():
+    from oauth2client.service_account import ServiceAccountCredentials
     try:
-        creds = ServiceAccountCredentials.from_json_keyfile_name(JSON_FILE, scope)
+        return ServiceAccountCredentials.from_json_keyfile_name(JSON_FILE, SCOPE)
     except FileNotFoundError:
         try:
             key_dict = dict(st.secrets["gcp_service_account"])
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(key_dict, scope)
+            return ServiceAccountCredentials.from_json_keyfile_dict(key_dict, SCOPE)
         except:
             return None
-    client = gspread.authorize(creds)
-    return client
 
-def get_data():
-    try:
+# 인증된 클라이언트, 스프레드시트, 워크시트 핸들을 프로세스 전체에서 한 번만 만들어 재사용
+@st.cache_resource(show_spinner=False)
+def get_connection():
+    return {"lock": threading.RLock(), "creds": None, "client": None, "key": None, "spreadsheet": None, "worksheets": {}}
+
+def reset_connection():
+    conn = get_connection()
+    with conn["lock"]:
+        conn.update(creds=None, client=None, spreadsheet=None, worksheets={})
+
+def get_client():
+    conn = get_connection()
+    with conn["lock"]:
+        creds = conn["creds"]
+        if conn["client"] is not None and not creds.access_token_expired:
+            return conn["client"]
+        if creds is None:
+            creds = get_credentials()
+            if creds is None: return None
+        # 토큰이 만료되면 같은 자격 증명으로 다시 authorize (gspread가 토큰을 갱신함)
+        import gspread
+        with timed("auth"):
+            client = gspread.authorize(creds)
+        session = getattr(getattr(client, "http_client", client), "session", None)
+        if session is not None and hasattr(session, "hooks"):
+            session.hooks.setdefault("response", []).append(perf_response_hook)
+        conn.update(creds=creds, client=client, spreadsheet=None, worksheets={})
+        return client
+
+def get_spreadsheet():
+    conn = get_connection()
+    with conn["lock"]:
         client = get_client()
-        if not client: return pd.DataFrame(columns=HEADERS)
-        sheet = client.open(SPREADSHEET_NAME).sheet1
-        
-        first_row = sheet.row_values(1)
-        if not first_row or first_row != HEADERS:
-            sheet.insert_row(HEADERS, index=1)
-            return pd.DataFrame(columns=HEADERS)
+        if client is None: return None
+        if conn["spreadsheet"] is None:
+            # 처음 한 번만 이름으로 찾고(Drive 검색), 이후에는 키로 바로 연다
+            with timed("open"):
+                if conn["key"]:
+                    conn["spreadsheet"] = client.open_by_key(conn["key"])
+                else:
+                    conn["spreadsheet"] = client.open(SPREADSHEET_NAME)
+                    conn["key"] = conn["spreadsheet"].id
+        return conn["spreadsheet"]
+
+def get_worksheet(title=None, headers=None):
+    conn = get_connection()
+    with conn["lock"]:
+        spreadsheet = get_spreadsheet()
+        if spreadsheet is None: return None
+        name = title or "sheet1"
+        if name not in conn["worksheets"]:
+            if title is None:
+                sheet = spreadsheet.sheet1
+            else:
+                from gspread.exceptions import WorksheetNotFound
+                try:
+                    sheet = spreadsheet.worksheet(title)
+                except WorksheetNotFound:
+                    if headers is None: raise
+                    sheet = spreadsheet.add_worksheet(title=title, rows=100, cols=10)
+                    sheet.append_row(headers)
+            conn["worksheets"][name] = sheet
+        return conn["worksheets"][name]
+
+# --- 저장소(backend) ---
+# 가계부 데이터를 어디에 저장할지 고르는 부분. storage_backend 설정으로 선택한다
+#   sheets: 구글 시트 (기본값)
+#   sqlite: 로컬 SQLite 파일 (sqlite_path, 네트워크 없이 실행/테스트 가능)
+# 모든 행은 ID 컬럼(new_id())으로 구분하고, 수정/삭제는 행 번호가 아니라 ID로 한다
+# (다른 사람이 먼저 행을 지워서 순서가 밀려도 엉뚱한 줄을 고치지 않도록)
+# partition_by_year를 켜면 가계부를 연도별로 나눠 저장하고 화면에 필요한 연도만 읽는다
+#   - 시트: 연도별 시트(가계부_2025 …) + 목록 시트(CATALOG_SHEET)에 연도별 행 수/합계/상태
+#   - SQLite: 날짜 인덱스로 연도 범위만 읽는다
+#   - 지난 연도는 ARCHIVE_GRACE_DAYS가 지나면 보관(읽기 전용) 처리하고 월/카테고리별 요약을 남긴다
+#   - 기존 sheet1은 migrate_partitions.py로 한 번 나눠 옮긴다
+# monthly_summary를 켜 두면(기본값) (연, 월, 카테고리, 사용자)별 합계를 월별 요약(MONTHLY_SHEET/monthly 테이블)에 따로 저장한다
+#   - 쓰기나 새로 읽은 내용으로 달라진 칸만 고쳐 쓰고, 추세 리포트는 가계부 대신 이 요약만 읽는다
+
+STORAGE_BACKEND = get_config("storage_backend", "sheets")
+SQLITE_PATH = get_config("sqlite_path", "ledger.db")
+PARTITION_BY_YEAR = get_config("partition_by_year", False)
+ARCHIVE_GRACE_DAYS = get_config("archive_grace_days", 31)
+MONTHLY_SUMMARY = get_config("monthly_summary", True)
+
+CATALOG_SHEET = "가계부목록"
+SUMMARY_SHEET = "가계부요약"
+MONTHLY_SHEET = "월별요약"
+CATALOG_HEADERS = ['연도', '행수', '지출', '수입', '상태']
+SUMMARY_HEADERS = ['연도', '월', '카테고리', '사용자', '지출', '지출건수', '수입', '수입건수']
+OPEN, ARCHIVED = "열림", "보관"
+
+class StorageUnavailable(RuntimeError):
+    # 인증 파일이 없거나 스프레드시트를 열 수 없는 경우
+    pass
+
+class RowNotFound(ValueError):
+    # 저장하거나 지우려는 ID가 시트에 없는 경우 (시트에서 직접 지웠거나 다른 화면에서 먼저 지움)
+    pass
+
+def new_id():
+    # 숫자로만 된 ID는 get_all_records가 숫자로 바꿔버리므로 문자로 시작하게 만든다
+    return "id" + uuid.uuid4().hex[:12]
+
+def partition_title(year):
+    return f"가계부_{year}"
+
+def year_of(value):
+    # 'YYYY-MM-DD' 문자열/date/Timestamp 모두 연도만 뽑는다
+    return int(str(value)[:4])
+
+def numeric_frame(records, headers, text=()):
+    # get_all_records/SQL 결과를 headers 순서의 프레임으로. text에 없는 컬럼은 정수로 바꾼다
+    df = pd.DataFrame(records, columns=headers)
+    for col in headers:
+        if col not in text:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int64')
+    return df
+
+def check_writable(backend, years):
+    # 보관된(읽기 전용) 연도에 쓰려고 하면 ValueError
+    if not backend.partitioned: return
+    archived = backend.archived_years() & {int(y) for y in years}
+    if archived: raise ValueError(f"{', '.join(map(str, sorted(archived)))}년은 보관된 연도라 수정할 수 없습니다.")
+
+class StorageBackend:
+    name = ""
+    partitioned = False   # 연도별로 나눠 저장하는지
+
+    def ensure_schema(self):
+        # 헤더/테이블이 올바르면 True, 새로 만들었으면 False
+        raise NotImplementedError
+
+    def warm_up(self):
+        # 로그인 화면이 떠 있는 동안 백그라운드에서 미리 해 둘 연결 작업 (저장소에 쓰지 않는다)
+        pass
+
+    def read_ledger(self, year=None):
+        # year: 연도별 저장소에서 읽을 연도 (나누지 않는 저장소는 항상 None)
+        raise NotImplementedError
+
+    def read_ledger_since(self, start, year=None):
+        # start번째 행부터 끝까지만 읽는다 (증분 동기화용)
+        return self.read_ledger(year).iloc[start:].reset_index(drop=True)
+
+    def read_fixed(self):
+        raise NotImplementedError
+
+    def append_rows(self, rows, fixed=False):
+        # rows의 마지막 값은 new_id()로 만든 ID
+        raise NotImplementedError
+
+    def update_cells(self, changes):
+        # changes: [(ID, col_name, value)]
+        raise NotImplementedError
+
+    def delete_rows(self, ids, fixed=False):
+        raise NotImplementedError
+
+    def catalog(self, refresh=False):
+        # 연도별 파티션 목록 (CATALOG_HEADERS). 연도로 나누지 않는 저장소는 빈 프레임
+        return pd.DataFrame(columns=CATALOG_HEADERS)
+
+    def write_catalog(self, year, rows, expense, income, status=OPEN):
+        # 목록을 따로 저장하지 않는 저장소는 할 일이 없다
+        pass
+
+    def read_summary(self):
+        # 보관된 연도의 (연, 월, 카테고리, 사용자)별 합계 (SUMMARY_HEADERS)
+        return pd.DataFrame(columns=SUMMARY_HEADERS)
+
+    def archive_year(self, year, summary, rows, expense, income):
+        # 요약을 저장하고 목록의 상태를 ARCHIVED로 바꾼다
+        raise NotImplementedError
+
+    def read_monthly(self):
+        # 월별 요약 (SUMMARY_HEADERS). 같은 칸이 여러 번 있으면 마지막 값
+        return pd.DataFrame(columns=SUMMARY_HEADERS)
+
+    def write_monthly(self, rows):
+        # rows: [연, 월, 카테고리, 사용자, 지출, 지출건수, 수입, 수입건수] 목록. 있는 칸은 고치고 없는 칸은 추가한다
+        raise NotImplementedError
+
+    def read_postings(self):
+        # 고정 지출 등록 기록 (POSTING_HEADERS, 모두 문자열)
+        return pd.DataFrame(columns=POSTING_HEADERS)
+
+    def append_postings(self, rows):
+        raise NotImplementedError
+
+    def archived_years(self):
+        catalog = self.catalog()
+        return set(catalog.loc[catalog['상태'] == ARCHIVED, '연도'].tolist())
+
+
+class SheetsBackend(StorageBackend):
+    name = "sheets"
+
+    def __init__(self):
+        # 헤더 확인/쓰기는 이 락 안에서 한다 (첫 화면의 읽기와 다른 세션이 동시에 빈 시트를 보고 헤더를 두 번 쓰지 않도록)
+        self.lock = threading.RLock()
+        self.header_ok = set()
+        self.monthly_rows = None   # 월별 요약 시트의 (연, 월, 카테고리, 사용자) → 행 번호
+        # 시트 이름(sheet1은 None) → {ID: 행 번호(헤더가 1행)} 캐시
+        # 쓰기 전에 해당 칸의 ID를 확인해서 어긋나 있으면 ID 컬럼만 다시 읽는다
+        self.rows = collections.defaultdict(dict)
+
+    @staticmethod
+    def headers(title):
+        return FIXED_HEADERS if title == FIXED_SHEET else HEADERS
+
+    def ledger_title(self, year=None):
+        # 가계부가 들어 있는 시트 이름 (None은 sheet1)
+        return None
+
+    def sheet(self, title=None, headers=None):
+        # 연결할 수 없으면 StorageUnavailable (get_worksheet는 None을 돌려준다)
+        sheet = get_worksheet(title, headers=headers or self.headers(title))
+        if not sheet: raise StorageUnavailable("구글 시트에 연결할 수 없습니다.")
+        return sheet
+
+    def check_header(self, title=None):
+        # 헤더가 맞으면 True. 빈 시트면 헤더를 쓰고, ID 컬럼이 없는 예전 시트면 ID 헤더만 추가한다
+        headers = self.headers(title)
+        with self.lock:
+            if title in self.header_ok: return True
+            sheet = self.sheet(title)
+            first_row = sheet.row_values(1)
+            if first_row == headers[:-1]:
+                sheet.update_cell(1, len(headers), headers[-1])
+            elif not first_row:
+                sheet.append_row(headers)
+            elif first_row != headers:
+                if title is not None: return False
+                sheet.insert_row(headers, index=1)
+                return False
+            self.header_ok.add(title)
+            return True
+
+    def ensure_schema(self):
+        return self.check_header(None)
+
+    def warm_up(self):
+        # 인증하고 스프레드시트를 열어 두기만 한다. 로그인 전이므로 헤더를 쓰거나 시트를 만들지 않는다
+        if get_spreadsheet() is None: raise StorageUnavailable("구글 시트에 연결할 수 없습니다.")
+
+    def records(self, title, df, start_row):
+        # ID가 비어 있는 행(예전 버전으로 추가한 행)에는 ID를 만들어 채워 넣고, ID → 행 번호 캐시를 갱신한다
+        headers = self.headers(title)
+        if df.empty: return df
+        df['ID'] = df['ID'].astype(str) if 'ID' in df.columns else ''
+        missing = df.index[df['ID'].isin(['', 'nan', 'None'])]
+        if len(missing):
+            df.loc[missing, 'ID'] = [new_id() for _ in missing]
+            self.sheet(title).batch_update([
+                {'range': cell_a1(start_row + i, len(headers)), 'values': [[df.at[i, 'ID']]]}
+                for i in missing
+            ])
+        self.rows[title].update(zip(df['ID'], range(start_row, start_row + len(df))))
+        return df
 
-        data = sheet.get_all_records()
+    def read_ledger(self, year=None):
+        title = self.ledger_title(year)
+        # 헤더는 프로세스에서 시트마다 한 번만 확인한다 (backend가 프로세스 캐시라 header_ok도 유지됨)
+        if title not in self.header_ok and not self.check_header(title): return pd.DataFrame(columns=HEADERS)
+        data = self.sheet(title).get_all_records()
+        self.rows[title] = {}
         if not data: return pd.DataFrame(columns=HEADERS)
         df = pd.DataFrame(data)
         if '날짜' not in df.columns: return pd.DataFrame(columns=HEADERS)
+        return self.records(title, df, 2)
+
+    def read_ledger_since(self, start, year=None):
+        title = self.ledger_title(year)
+        values = self.sheet(title).get(f"A{start + 2}:G")
+        rows = [list(r)[:len(HEADERS)] + [''] * (len(HEADERS) - len(r)) for r in values]
+        return self.records(title, pd.DataFrame(rows, columns=HEADERS), start + 2)
+
+    def read_fixed(self):
+        if FIXED_SHEET not in self.header_ok and not self.check_header(FIXED_SHEET): return pd.DataFrame(columns=FIXED_HEADERS)
+        data = self.sheet(FIXED_SHEET).get_all_records()
+        self.rows[FIXED_SHEET] = {}
+        if not data: return pd.DataFrame(columns=FIXED_HEADERS)
+        return self.records(FIXED_SHEET, pd.DataFrame(data), 2)
+
+    def group_rows(self, rows):
+        # 추가할 가계부 행을 들어갈 시트별로 나눈다
+        return {None: rows}
+
+    def append_rows(self, rows, fixed=False):
+        groups = {FIXED_SHEET: rows} if fixed else self.group_rows(rows)
+        for title, part in groups.items():
+            sheet = self.sheet(title)
+            if title not in self.header_ok: self.check_header(title)
+            if len(part) == 1:
+                sheet.append_row(part[0])
+            else:
+                sheet.append_rows(part)
+            start = max(self.rows[title].values(), default=1) + 1
+            self.rows[title].update((row[-1], start + i) for i, row in enumerate(part))
+
+    def titles_of(self, ids, fixed=False):
+        # {ID: 그 행이 있는 시트 이름}
+        return {i: FIXED_SHEET if fixed else None for i in ids}
+
+    def locate(self, ids, title=None):
+        # ID들의 현재 시트 행 번호. 캐시가 맞는지 batch_get 한 번으로 확인하고, 틀리면 ID 컬럼만 다시 읽는다
+        sheet = self.sheet(title)
+        id_col = len(self.headers(title))
+        rows = self.rows[title]
+        if ids and all(i in rows for i in ids):
+            found = sheet.batch_get([cell_a1(rows[i], id_col) for i in ids])
+            if [v[0][0] if v and v[0] else '' for v in found] == list(ids):
+                return [rows[i] for i in ids]
+        values = sheet.col_values(id_col)
+        rows = self.rows[title] = {v: r for r, v in enumerate(values[1:], start=2) if v}
+        missing = [i for i in ids if i not in rows]
+        if missing: raise RowNotFound(f"이미 삭제되었거나 찾을 수 없는 내역입니다: {missing}")
+        return [rows[i] for i in ids]
+
+    def update_cells(self, changes):
+        titles = self.titles_of([row_id for row_id, _, _ in changes])
+        for title in dict.fromkeys(titles.values()):
+            part = [change for change in changes if titles[change[0]] == title]
+            positions = self.locate([row_id for row_id, _, _ in part], title)
+            data = [
+                {'range': cell_a1(row, COL_MAP[col_name]), 'values': [[value]]}
+                for row, (_, col_name, value) in zip(positions, part)
+            ]
+            self.sheet(title).batch_update(data, value_input_option='USER_ENTERED')
+
+    def delete_rows(self, ids, fixed=False, titles=None):
+        # 여러 행을 deleteDimension 요청 하나로 지운다 (시트가 여러 개여도 한 번). 뒤에서부터 지워야 앞쪽 행 번호가 밀리지 않는다
+        # titles({ID: 시트 이름})를 주면 ID를 찾지 않고 그 시트에서만 지운다
+        ids = list(ids)
+        titles = titles or self.titles_of(ids, fixed)
+        positions, requests, spreadsheet = {}, [], None
+        for title in dict.fromkeys(titles.values()):
+            sheet = self.sheet(title)
+            spreadsheet = sheet.spreadsheet
+            positions[title] = sorted(set(self.locate([i for i in ids if titles[i] == title], title)), reverse=True)
+            requests += [
+                {'deleteDimension': {'range': {'sheetId': sheet.id, 'dimension': 'ROWS', 'startIndex': row - 1, 'endIndex': row}}}
+                for row in positions[title]
+            ]
+        if not requests: return
+        spreadsheet.batch_update({'requests': requests})
+        deleted = set(ids)
+        for title, rows in positions.items():
+            self.rows[title] = {
+                row_id: row - sum(1 for p in rows if p < row)
+                for row_id, row in self.rows[title].items() if row_id not in deleted
+            }
+
+    def read_monthly(self):
+        records = self.sheet(MONTHLY_SHEET, SUMMARY_HEADERS).get_all_records()
+        df = numeric_frame(records, SUMMARY_HEADERS, text=('카테고리', '사용자'))
+        self.monthly_rows = {tuple(key): row for row, key in enumerate(df[SUMMARY_HEADERS[:4]].values.tolist(), start=2)}
         return df
+
+    def write_monthly(self, rows):
+        # 이미 있는 칸은 batch_update 한 번, 새 칸은 append_rows 한 번
+        if self.monthly_rows is None: self.read_monthly()
+        sheet = self.sheet(MONTHLY_SHEET, SUMMARY_HEADERS)
+        updates, appends = [], []
+        for row in rows:
+            key = tuple(row[:4])
+            if key in self.monthly_rows:
+                r = self.monthly_rows[key]
+                updates.append({'range': f"A{r}:H{r}", 'values': [list(row)]})
+            else:
+                appends.append(list(row))
+        if updates: sheet.batch_update(updates)
+        if appends:
+            sheet.append_rows(appends)
+            start = max(self.monthly_rows.values(), default=1) + 1
+            self.monthly_rows.update((tuple(row[:4]), start + i) for i, row in enumerate(appends))
+
+    def read_postings(self):
+        records = self.sheet(POSTING_SHEET, POSTING_HEADERS).get_all_records()
+        return pd.DataFrame(records, columns=POSTING_HEADERS).astype(str)
+
+    def append_postings(self, rows):
+        self.sheet(POSTING_SHEET, POSTING_HEADERS).append_rows(rows)
+
+
+class PartitionedSheetsBackend(SheetsBackend):
+    # 가계부를 연도별 시트에 나눠 저장한다. 목록 시트는 프로세스에서 한 번 읽어 두고 쓸 때 같이 고친다
+    partitioned = True
+
+    def __init__(self):
+        super().__init__()
+        self.catalog_df = None
+
+    def ledger_title(self, year=None):
+        if year is None: raise ValueError("연도별 저장소에서는 읽을 연도를 정해야 합니다.")
+        return partition_title(year)
+
+    def catalog(self, refresh=False):
+        with self.lock:
+            if self.catalog_df is None or refresh:
+                records = self.sheet(CATALOG_SHEET, CATALOG_HEADERS).get_all_records()
+                self.catalog_df = numeric_frame(records, CATALOG_HEADERS, text=('상태',))
+            return self.catalog_df
+
+    def write_catalog(self, year, rows, expense, income, status=OPEN):
+        with self.lock:
+            catalog = self.catalog()
+            values = [int(year), int(rows), int(expense), int(income), status]
+            sheet = self.sheet(CATALOG_SHEET, CATALOG_HEADERS)
+            match = catalog.index[catalog['연도'] == year]
+            if len(match):
+                row = int(match[0]) + 2
+                sheet.batch_update([{'range': f"A{row}:E{row}", 'values': [values]}])
+                catalog = catalog.copy()
+                catalog.loc[match[0]] = values
+            else:
+                sheet.append_row(values)
+                catalog = pd.concat([catalog, pd.DataFrame([values], columns=CATALOG_HEADERS)], ignore_index=True)
+            self.catalog_df = catalog
+
+    def group_rows(self, rows):
+        groups = collections.defaultdict(list)
+        for row in rows:
+            groups[year_of(row[0])].append(row)
+        check_writable(self, groups)
+        known = set(self.catalog()['연도'].tolist())
+        for year in groups:
+            # 처음 쓰는 연도면 목록에 올린다 (시트는 get_worksheet가 헤더와 함께 만든다)
+            if year not in known: self.write_catalog(year, 0, 0, 0)
+        return {partition_title(year): part for year, part in groups.items()}
+
+    def titles_of(self, ids, fixed=False):
+        if fixed: return super().titles_of(ids, fixed)
+        found = {i: title for title, rows in self.rows.items() if title != FIXED_SHEET for i in ids if i in rows}
+        missing = [i for i in ids if i not in found]
+        # 어느 연도에 있는지 모르는 ID는 최근 연도부터 ID 컬럼을 읽어서 찾는다
+        for year in sorted(self.catalog()['연도'].tolist(), reverse=True):
+            if not missing: break
+            title = partition_title(year)
+            values = self.sheet(title).col_values(len(HEADERS))
+            self.rows[title] = {v: r for r, v in enumerate(values[1:], start=2) if v}
+            found.update((i, title) for i in missing if i in self.rows[title])
+            missing = [i for i in missing if i not in found]
+        if missing: raise RowNotFound(f"이미 삭제되었거나 찾을 수 없는 내역입니다: {missing}")
+        return found
+
+    def update_cells(self, changes):
+        # 날짜가 다른 연도로 바뀐 행은 그 연도 시트로 옮긴다 (현재 값을 읽어 새 시트에 추가한 뒤 원래 행 삭제)
+        # 추가하고 나면 같은 ID가 두 시트에 있으므로 지울 때는 처음 찾아 둔 원래 시트를 알려 준다
+        titles = self.titles_of([row_id for row_id, _, _ in changes])
+        moved = {row_id for row_id, col_name, value in changes
+                 if col_name == '날짜' and partition_title(year_of(value)) != titles[row_id]}
+        if moved:
+            rows = []
+            for row_id in moved:
+                title = titles[row_id]
+                values = self.sheet(title).row_values(self.locate([row_id], title)[0])
+                values = list(values[:len(HEADERS)]) + [''] * (len(HEADERS) - len(values))
+                for changed_id, col_name, value in changes:
+                    if changed_id == row_id: values[COL_MAP[col_name] - 1] = value
+                rows.append(values)
+            self.append_rows(rows)
+            self.delete_rows(moved, titles={row_id: titles[row_id] for row_id in moved})
+        rest = [change for change in changes if change[0] not in moved]
+        if rest: super().update_cells(rest)
+
+    def read_summary(self):
+        records = self.sheet(SUMMARY_SHEET, SUMMARY_HEADERS).get_all_records()
+        return numeric_frame(records, SUMMARY_HEADERS, text=('카테고리', '사용자'))
+
+    def archive_year(self, year, summary, rows, expense, income):
+        with self.lock:
+            if len(summary):
+                self.sheet(SUMMARY_SHEET, SUMMARY_HEADERS).append_rows(summary.values.tolist())
+            # 시트에서 사람이 직접 고치려고 하면 경고가 뜨도록 보호 범위를 건다 (앱의 쓰기는 group_rows에서 막음)
+            sheet = self.sheet(partition_title(year))
+            sheet.spreadsheet.batch_update({'requests': [{'addProtectedRange': {'protectedRange': {
+                'range': {'sheetId': sheet.id}, 'description': f"{year}년 보관 (읽기 전용)", 'warningOnly': True}}}]})
+            self.write_catalog(year, rows, expense, income, ARCHIVED)
+
+
+class SqliteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path, partitioned=False):
+        self.path = path
+        self.partitioned = partitioned
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.catalog_df = None
+        self.ensure_schema()
+
+    @staticmethod
+    def table(fixed):
+        return ("fixed", FIXED_HEADERS) if fixed else ("ledger", HEADERS)
+
+    @staticmethod
+    def columns(headers):
+        # SQLite는 컬럼 이름의 대소문자를 구분하지 않아서 ID를 내부 순번 id와 겹치지 않게 uid로 저장한다
+        return ", ".join('uid' if c == 'ID' else f'"{c}"' for c in headers)
+
+    @staticmethod
+    def year_range(year):
+        # 날짜 인덱스를 그대로 쓸 수 있도록 문자열 범위로 비교한다
+        return (f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+
+    def ensure_schema(self):
+        with self.lock:
+            exists = self.db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='ledger'").fetchone()
+            self.db.executescript('''
+                CREATE TABLE IF NOT EXISTS ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    "날짜" TEXT, "구분" TEXT, "사용자" TEXT, "카테고리" TEXT, "내역" TEXT, "금액" INTEGER, uid TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_ledger_date ON ledger("날짜");
+                CREATE INDEX IF NOT EXISTS idx_ledger_category ON ledger("카테고리");
+                CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger("사용자");
+                CREATE TABLE IF NOT EXISTS fixed (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    "일자" INTEGER, "구분" TEXT, "사용자" TEXT, "카테고리" TEXT, "내역" TEXT, "금액" INTEGER, uid TEXT
+                );
+                CREATE TABLE IF NOT EXISTS archived (
+                    "연도" INTEGER PRIMARY KEY, "행수" INTEGER, "지출" INTEGER, "수입" INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS summary (
+                    "연도" INTEGER, "월" INTEGER, "카테고리" TEXT, "사용자" TEXT,
+                    "지출" INTEGER, "지출건수" INTEGER, "수입" INTEGER, "수입건수" INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS monthly (
+                    "연도" INTEGER, "월" INTEGER, "카테고리" TEXT, "사용자" TEXT,
+                    "지출" INTEGER, "지출건수" INTEGER, "수입" INTEGER, "수입건수" INTEGER,
+                    PRIMARY KEY ("연도", "월", "카테고리", "사용자")
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    "항목ID" TEXT, "월" TEXT, "내역ID" TEXT, "등록시각" TEXT,
+                    PRIMARY KEY ("항목ID", "월")
+                );
+            ''')
+            with self.db:
+                for table in ("ledger", "fixed"):
+                    # ID 컬럼이 없던 예전 파일은 컬럼을 추가하고 기존 행에 ID를 채운다
+                    if 'uid' not in [r[1] for r in self.db.execute(f"PRAGMA table_info({table})")]:
+                        self.db.execute(f"ALTER TABLE {table} ADD COLUMN uid TEXT")
+                    self.db.execute(f"UPDATE {table} SET uid = 'id' || lower(hex(randomblob(6))) WHERE uid IS NULL")
+                    self.db.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_uid ON {table}(uid)")
+            return exists is not None
+
+    def read(self, fixed):
+        table, headers = self.table(fixed)
+        count_api()
+        with self.lock:
+            df = pd.read_sql_query(f"SELECT {self.columns(headers)} FROM {table} ORDER BY id", self.db)
+        return df.rename(columns={'uid': 'ID'})
+
+    def read_ledger(self, year=None):
+        if year is None: return self.read(False)
+        return self.read_ledger_since(0, year)
+
+    def read_ledger_since(self, start, year=None):
+        where, params = "", (start,)
+        if year is not None:
+            where, params = 'WHERE "날짜" >= ? AND "날짜" < ?', self.year_range(year) + (start,)
+        count_api()
+        with self.lock:
+            df = pd.read_sql_query(f"SELECT {self.columns(HEADERS)} FROM ledger {where} ORDER BY id LIMIT -1 OFFSET ?", self.db, params=params)
+        return df.rename(columns={'uid': 'ID'})
+
+    def read_fixed(self):
+        return self.read(True)
+
+    def append_rows(self, rows, fixed=False):
+        table, headers = self.table(fixed)
+        marks = ", ".join("?" for _ in headers)
+        count_api()
+        with self.lock, self.db:
+            self.db.executemany(f"INSERT INTO {table} ({self.columns(headers)}) VALUES ({marks})", rows)
+            self.catalog_df = None
+
+    def update_cells(self, changes):
+        count_api()
+        with self.lock, self.db:
+            for row_id, col_name, value in changes:
+                self.db.execute(f'UPDATE ledger SET "{col_name}" = ? WHERE uid = ?', (value, row_id))
+            self.catalog_df = None
+
+    def delete_rows(self, ids, fixed=False):
+        table, _ = self.table(fixed)
+        count_api()
+        with self.lock, self.db:
+            self.db.executemany(f"DELETE FROM {table} WHERE uid = ?", [(i,) for i in ids])
+            self.catalog_df = None
+
+    def catalog(self, refresh=False):
+        # 연도별 행 수/합계는 날짜 인덱스로 바로 계산하고, 보관 여부만 archived 테이블에 둔다
+        if not self.partitioned: return super().catalog()
+        with self.lock:
+            if self.catalog_df is None or refresh:
+                df = pd.read_sql_query('''
+                    SELECT CAST(substr("날짜", 1, 4) AS INTEGER) AS "연도", COUNT(*) AS "행수",
+                           SUM(CASE WHEN "구분" = '지출' THEN "금액" ELSE 0 END) AS "지출",
+                           SUM(CASE WHEN "구분" = '수입' THEN "금액" ELSE 0 END) AS "수입"
+                    FROM ledger WHERE "날짜" GLOB '[0-9][0-9][0-9][0-9]-*' GROUP BY 1 ORDER BY 1
+                ''', self.db)
+                archived = {r[0] for r in self.db.execute('SELECT "연도" FROM archived')}
+                df['상태'] = [ARCHIVED if year in archived else OPEN for year in df['연도']]
+                self.catalog_df = numeric_frame(df, CATALOG_HEADERS, text=('상태',))
+            return self.catalog_df
+
+    def read_summary(self):
+        with self.lock:
+            df = pd.read_sql_query(f"SELECT {self.columns(SUMMARY_HEADERS)} FROM summary", self.db)
+        return numeric_frame(df, SUMMARY_HEADERS, text=('카테고리', '사용자'))
+
+    def archive_year(self, year, summary, rows, expense, income):
+        with self.lock, self.db:
+            self.db.executemany(f"INSERT INTO summary VALUES ({', '.join('?' for _ in SUMMARY_HEADERS)})", summary.values.tolist())
+            self.db.execute("INSERT OR REPLACE INTO archived VALUES (?, ?, ?, ?)", (int(year), int(rows), int(expense), int(income)))
+            self.catalog_df = None
+
+    def read_monthly(self):
+        with self.lock:
+            df = pd.read_sql_query(f"SELECT {self.columns(SUMMARY_HEADERS)} FROM monthly", self.db)
+        return numeric_frame(df, SUMMARY_HEADERS, text=('카테고리', '사용자'))
+
+    def write_monthly(self, rows):
+        count_api()
+        with self.lock, self.db:
+            self.db.executemany(f"INSERT OR REPLACE INTO monthly VALUES ({', '.join('?' for _ in SUMMARY_HEADERS)})", rows)
+
+    def read_postings(self):
+        with self.lock:
+            df = pd.read_sql_query('SELECT "항목ID", "월", "내역ID", "등록시각" FROM postings', self.db)
+        return df.astype(str)
+
+    def append_postings(self, rows):
+        # 같은 (항목, 달)이 이미 있으면 먼저 등록한 기록을 남긴다
+        count_api()
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?, ?, ?)", rows)
+
+
+@st.cache_resource(show_spinner=False)
+def get_backend():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteBackend(SQLITE_PATH, partitioned=PARTITION_BY_YEAR)
+    if PARTITION_BY_YEAR:
+        return PartitionedSheetsBackend()
+    return SheetsBackend()
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    # 프로세스에서 한 번, 시트 라이브러리 import → 인증 → 스프레드시트 열기를 백그라운드로 미리 한다
+    # 그동안 화면(로그인)은 먼저 그려지고, 로그인 후 첫 get_data()는 연결 락에서 남은 연결 작업만 기다린다
+    # 헤더 확인과 시트 만들기는 로그인 뒤 첫 읽기/쓰기에서 백엔드 락을 잡고 한다
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+@timed("warm_up")
+def warm_up():
+    try:
+        get_backend().warm_up()
     except:
-        return pd.DataFrame(columns=HEADERS)
+        # 실패해도 괜찮다. 첫 get_data()가 다시 연결을 시도하고 에러를 보여준다
+        reset_connection()
 
-def get_fixed_data():
+@timed("load_ledger")
+def load_ledger(year=None):
+    # 저장소에 닿지 못했으면 None. 그 밖의 에러는 그대로 올려 보낸다
     try:
-        client = get_client()
-        if not client: return pd.DataFrame(columns=FIXED_HEADERS)
+        return get_backend().read_ledger(year)
+    except Exception as e:
+        if not is_storage_error(e): raise
+        reset_connection()
+        return None
+
+# 구분/사용자/카테고리는 기본 목록 + 시트에 실제로 있는 값을 범주로 하는 category 타입으로 둔다
+CATEGORY_COLUMNS = (('구분', TYPES), ('사용자', USERS), ('카테고리', ALL_CATS))
+
+def conform_ledger(df):
+    # concat 등으로 category 타입이 풀렸거나 범주가 달라진 컬럼을 다시 맞춘다 (이미 맞으면 그대로)
+    for col, known in CATEGORY_COLUMNS:
+        values = df[col]
+        found = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else values.dropna().unique()
+        extra = sorted(set(map(str, found)) - set(known))
+        dtype = pd.CategoricalDtype(known + extra)
+        if values.dtype != dtype:
+            df[col] = values.astype(str).where(values.notna()).astype(dtype) if not isinstance(values.dtype, pd.CategoricalDtype) else values.astype(dtype)
+    return df
+
+def empty_ledger():
+    return conform_ledger(pd.DataFrame({
+        '날짜': pd.Series(dtype='datetime64[ns]'), '구분': pd.Series(dtype=object), '사용자': pd.Series(dtype=object),
+        '카테고리': pd.Series(dtype=object), '내역': pd.Series(dtype=object), '금액': pd.Series(dtype='int64'), 'ID': pd.Series(dtype=object),
+    }))
+
+@timed("parse_ledger")
+def parse_ledger(raw):
+    # 시트/DB에서 읽은 원본을 한 번에 정규화한다: 날짜 datetime64[ns], 금액 int64, 구분/사용자/카테고리 category
+    # 날짜나 금액을 읽을 수 없는 행은 전체를 버리지 않고 따로 모아서 돌려준다 → (정상 행, 문제 행)
+    raw = raw.reset_index(drop=True)
+    if raw.empty: return empty_ledger(), raw
+    for col in HEADERS:
+        if col not in raw.columns: raw[col] = ''
+
+    text_dates = raw['날짜'].astype(str).str.strip()
+    dates = pd.to_datetime(text_dates, format='%Y-%m-%d', errors='coerce')
+    retry = dates.isna() & (text_dates != '')
+    if retry.any():
+        dates[retry] = pd.to_datetime(text_dates[retry], format='mixed', errors='coerce')
+    if pd.api.types.is_numeric_dtype(raw['금액']):
+        amounts = pd.to_numeric(raw['금액'], errors='coerce')
+    else:
+        amounts = pd.to_numeric(raw['금액'].astype(str).str.replace(',', '', regex=False).str.strip(), errors='coerce')
+
+    bad = dates.isna() | amounts.isna()
+    ok = ~bad
+    df = pd.DataFrame({
+        '날짜': dates[ok].astype('datetime64[ns]'),
+        '구분': raw.loc[ok, '구분'], '사용자': raw.loc[ok, '사용자'], '카테고리': raw.loc[ok, '카테고리'],
+        '내역': raw.loc[ok, '내역'].astype(str),
+        '금액': amounts[ok].round().astype('int64'),
+        'ID': raw.loc[ok, 'ID'].astype(str),
+    }).reset_index(drop=True)
+    return conform_ledger(df), raw[bad]
+
+def isin_codes(series, values):
+    # category 컬럼은 문자열 비교 대신 정수 코드로 걸러낸다
+    if not isinstance(series.dtype, pd.CategoricalDtype): return series.isin(values)
+    codes = series.cat.categories.get_indexer(list(values))
+    return pd.Series(np.isin(series.cat.codes.to_numpy(), codes[codes >= 0]), index=series.index)
+
+def month_frame(df, year, month):
+    # year년 month월 내역만. .dt.year/.dt.month로 행마다 뽑지 않고 그 달 1일~다음 달 1일 경계값과 비교한다
+    if df.empty: return df
+    start = np.datetime64(f"{year:04d}-{month:02d}-01", 'ns')
+    end = np.datetime64(f"{year + month // 12:04d}-{month % 12 + 1:02d}-01", 'ns')
+    dates = df['날짜'].to_numpy()
+    return df.loc[(dates >= start) & (dates < end)]
+
+@timed("load_fixed")
+def load_fixed():
+    try:
+        return get_backend().read_fixed()
+    except Exception as e:
+        if not is_storage_error(e): raise
+        reset_connection()
+        return None
+
+# 지출/수입 합계와 건수를 (연, 월, 일) / (연, 월) / (연, 월, 카테고리, 사용자) 단위로 미리 계산해 둔 인덱스
+# 가계부를 읽을 때 한 번 만들고, 쓰기가 있을 때는 바뀐 행만 빼고(sign=-1) 더해서(sign=1) 갱신한다
+# 값은 항상 [지출 합계, 지출 건수, 수입 합계, 수입 건수]
+class AggregateIndex:
+    def __init__(self, df=None):
+        self.daily = {}
+        self.monthly = {}
+        self.by_category = {}
+        if df is not None: self.apply(df)
+
+    def apply(self, df, sign=1):
+        if df is None or df.empty: return
+        is_exp = (df['구분'] == '지출').astype('int64')
+        is_inc = (df['구분'] == '수입').astype('int64')
+        frame = pd.DataFrame({
+            'y': df['날짜'].dt.year, 'm': df['날짜'].dt.month, 'd': df['날짜'].dt.day,
+            'cat': df['카테고리'].astype(str), 'user': df['사용자'].astype(str),
+            'exp': df['금액'] * is_exp, 'exp_n': is_exp, 'inc': df['금액'] * is_inc, 'inc_n': is_inc,
+        })
+        for target, keys in ((self.daily, ['y', 'm', 'd']), (self.monthly, ['y', 'm']), (self.by_category, ['y', 'm', 'cat', 'user'])):
+            sums = frame.groupby(keys)[['exp', 'exp_n', 'inc', 'inc_n']].sum()
+            for key, values in zip(sums.index, sums.to_numpy().tolist()):
+                new = [a + sign * b for a, b in zip(target.get(key, [0, 0, 0, 0]), values)]
+                if new[1] == 0 and new[3] == 0:
+                    target.pop(key, None)
+                else:
+                    target[key] = new
+
+    def drop_year(self, year):
+        # 연도 하나를 통째로 다시 읽을 때 그 연도 합계를 모두 지운다 (보관 요약으로 채운 값 포함)
+        for target in (self.daily, self.monthly, self.by_category):
+            for key in [k for k in target if k[0] == year]:
+                del target[key]
+
+    def apply_summary(self, summary):
+        # 보관된 연도의 요약(SUMMARY_HEADERS)으로 월/카테고리 합계를 채운다. 일별 합계는 그 연도를 읽을 때 채워진다
+        for year, month, cat, user, *values in summary.itertuples(index=False):
+            for target, key in ((self.monthly, (year, month)), (self.by_category, (year, month, cat, user))):
+                target[key] = [a + b for a, b in zip(target.get(key, [0, 0, 0, 0]), values)]
+
+    def day_totals(self, year, month, day):
+        return self.daily.get((year, month, day), [0, 0, 0, 0])
+
+    def month_days(self, year, month):
+        # [(일, [지출 합계, 지출 건수, 수입 합계, 수입 건수])] 그 달의 모든 날 (내역이 없는 날은 0)
+        return [(day, self.day_totals(year, month, day)) for day in range(1, calendar.monthrange(year, month)[1] + 1)]
+
+    def month_totals(self, year, month):
+        return self.monthly.get((year, month), [0, 0, 0, 0])
+
+    def category_totals(self, year, month):
+        # {(카테고리, 사용자): [지출 합계, 지출 건수, 수입 합계, 수입 건수]}
+        return {key[2:]: values for key, values in self.by_category.items() if key[:2] == (year, month)}
+
+# 파싱된 가계부/고정지출 프레임을 모든 세션이 공유하는 캐시 (CACHE_TTL초 동안 유효)
+# 쓰기 함수들은 시트에 반영한 뒤 캐시를 직접 고치거나 비워서 방금 쓴 내용이 바로 보이게 한다
+# 가계부는 파티션(연도별 저장소면 연도, 아니면 None 하나) 단위로 읽고 parts에 파티션별 상태를 둔다
+#   raw_rows: 저장소의 원본 행 수 (증분 동기화 기준), bad_rows: 읽지 못한 행, loaded_at/full_at: 마지막 확인/전체 읽기 시각
+# monthly: 저장소의 월별 요약을 그대로 옮겨 둔 사전 {(연, 월, 카테고리, 사용자): [지출, 지출건수, 수입, 수입건수]}
+# snapshot/offline/refresh/saved_*: 로컬 스냅샷 상태 (아래 "로컬 스냅샷" 참고)
+@st.cache_resource(show_spinner=False)
+def get_frame_cache():
+    return {"lock": threading.RLock(), "ledger": None, "index": AggregateIndex(), "positions": None,
+            "parts": {}, "version": 0, "archive_checked": None, "fixed": None, "fixed_at": 0.0, "monthly": None,
+            "catalog_rows": {}, "postings": None, "snapshot": None, "offline": None, "refresh": None, "refresh_at": float("-inf"),
+            "saved_version": None, "saved_at": float("-inf")}
+
+def invalidate_cache(ledger=True, fixed=True):
+    cache = get_frame_cache()
+    with cache["lock"]:
+        # 스냅샷을 보여주는 중이면 백그라운드 새로 읽기가 어차피 통째로 바꿔 넣으므로 그대로 둔다
+        if cache["snapshot"] is not None: return
+        if ledger: cache.update(ledger=None, monthly=None, catalog_rows={})
+        if fixed: cache.update(fixed=None, postings=None)
+
+def tail_checksum(df):
+    # 날짜/금액 형식 차이(시트 표시 형식 vs 파싱 결과)에 영향받지 않도록 정규화한 뒤 해시
+    if df.empty: return ""
+    norm = df[HEADERS].copy()
+    norm['날짜'] = norm['날짜'].dt.strftime('%Y-%m-%d')
+    norm['금액'] = norm['금액'].astype('int64')
+    return hashlib.md5(norm.astype(str).to_csv(index=False, header=False).encode()).hexdigest()
+
+def partition_mask(df, key):
+    # 캐시된 프레임에서 파티션 key(연도, None이면 전체)에 속하는 행
+    if key is None: return np.ones(len(df), dtype=bool)
+    dates = df['날짜'].to_numpy()
+    return (dates >= np.datetime64(f"{key:04d}-01-01", 'ns')) & (dates < np.datetime64(f"{key + 1:04d}-01-01", 'ns'))
+
+def partition_keys(years, loaded=()):
+    # 읽어야 할 파티션. 연도로 나누지 않는 저장소는 항상 [None], 아니면 요청한 연도 중 실제로 있는 연도
+    # years가 ()이면 이미 읽어 둔 연도(loaded)만
+    backend = get_backend()
+    if not backend.partitioned: return [None]
+    if years == (): return sorted(loaded)
+    known = set(backend.catalog()['연도'].tolist())
+    return sorted(known if years is None else known & {int(y) for y in years})
+
+@timed("sync_ledger")
+def sync_ledger(cache, key=None):
+    # 마지막으로 알고 있던 끝부분(SYNC_TAIL_ROWS행)부터 다시 읽어서 새로 추가된 행만 돌려준다 → (새 정상 행, 새 문제 행, 새 원본 행 수)
+    # 끝부분 행 수가 줄었거나 내용(checksum)이 다르면 삭제/수정이 있었던 것이므로 None → 전체 다시 읽기
+    cached = cache["ledger"] if key is None else cache["ledger"][partition_mask(cache["ledger"], key)]
+    n = cache["parts"][key]["raw_rows"]
+    k = min(SYNC_TAIL_ROWS, n)
+    try:
+        raw = get_backend().read_ledger_since(n - k, key)
+    except:
+        return None
+    if len(raw) < k: return None
+    overlap, _ = parse_ledger(raw.iloc[:k])
+    if len(overlap) > len(cached) or tail_checksum(overlap) != tail_checksum(cached.tail(len(overlap))): return None
+    new_df, bad = parse_ledger(raw.iloc[k:])
+    return new_df, bad, len(raw) - k
+
+def replace_partition(cache, key, df):
+    # 캐시에서 파티션 key의 행을 모두 빼고 새로 읽은 df로 바꾼다
+    ledger = cache["ledger"]
+    if key is None:
+        kept = ledger.iloc[:0]
+        cache["index"] = AggregateIndex(df)
+    else:
+        kept = ledger[~partition_mask(ledger, key)]
+        cache["index"].drop_year(key)
+        cache["index"].apply(df)
+    cache["ledger"] = conform_ledger(df if kept.empty else pd.concat([kept, df], ignore_index=True))
+    cache["positions"] = None
+    cache["version"] += 1
+
+def load_partition(cache, key):
+    # 파티션을 처음 읽거나, CACHE_TTL이 지났으면 증분 동기화(또는 전체 다시 읽기)한다. 보관된 연도는 한 번만 읽는다
+    # 저장소에서 읽지 못했으면 False
+    now = time.monotonic()
+    part = cache["parts"].get(key)
+    # 아직 저장되지 않은 쓰기가 있으면 저장소 내용이 캐시보다 뒤처져 있으므로 다시 읽지 않는다
+    if part is not None and (part["archived"] or now - part["loaded_at"] <= CACHE_TTL or has_pending_writes()): return True
+    synced = None
+    # 중간 행이 수정된 경우는 끝부분만 봐서는 알 수 없으므로 FULL_SYNC_INTERVAL마다 전체를 다시 읽는다
+    if part is not None and part["raw_rows"] > 0 and now - part["full_at"] < FULL_SYNC_INTERVAL:
+        synced = sync_ledger(cache, key)
+    if synced is not None:
+        new_df, bad, added = synced
+        if not new_df.empty:
+            cache["ledger"] = conform_ledger(pd.concat([cache["ledger"], new_df], ignore_index=True))
+            cache["index"].apply(new_df)
+            cache["positions"] = None
+            cache["version"] += 1
+            sync_monthly(cache, new_df['날짜'].dt.year.unique().tolist())
+            sync_catalog(cache, new_df['날짜'].dt.year.unique().tolist())
+        if not bad.empty:
+            part["bad_rows"] = pd.concat([part["bad_rows"], bad], ignore_index=True)
+        part["raw_rows"] += added
+    else:
+        raw = load_ledger(key)
+        if raw is None: return False
+        df, bad = parse_ledger(raw)
+        replace_partition(cache, key, df)
+        archived = key is not None and key in get_backend().archived_years()
+        part = cache["parts"][key] = {"raw_rows": len(raw), "bad_rows": bad, "full_at": now, "archived": archived}
+        sync_monthly(cache, df['날짜'].dt.year.unique().tolist() if key is None else [key])
+        sync_catalog(cache, [key])
+    part["loaded_at"] = now
+    return True
+
+def load_monthly(cache):
+    # 저장소의 월별 요약을 한 번 읽어 둔다. 요약에 없는 보관 연도는 보관 요약(read_summary)으로 채워서 같이 저장한다
+    if cache["monthly"] is not None: return cache["monthly"]
+    backend = get_backend()
+    df = backend.read_monthly()
+    monthly = {tuple(row[:4]): row[4:] for row in df.values.tolist()}
+    if backend.partitioned:
+        missing = backend.archived_years() - {key[0] for key in monthly}
+        if missing:
+            summary = backend.read_summary()
+            rows = summary[summary['연도'].isin(missing)].values.tolist()
+            if rows:
+                persist("monthly", rows)
+                monthly.update((tuple(row[:4]), row[4:]) for row in rows)
+    cache["monthly"] = monthly
+    return monthly
+
+def sync_monthly(cache, years):
+    # 다 읽어 둔 연도의 (연, 월, 카테고리, 사용자)별 합계(집계 인덱스)를 저장된 월별 요약과 비교해서 달라진 칸만 저장한다
+    # 앱에서 쓸 때(patch_ledger)와 저장소에서 새로 읽었을 때(load_partition) 부르므로 다른 곳에서 고친 내용도 여기서 맞춰진다
+    if not MONTHLY_SUMMARY: return
+    parts = cache["parts"]
+    # 일부 행만 캐시에 있는 연도(연도별 저장소에서 아직 읽지 않은 연도에 추가한 경우)는 합계가 틀리므로 건너뛴다
+    years = {int(y) for y in years if None in parts or y in parts}
+    if not years: return
+    try:
+        stored = load_monthly(cache)
+        current = {key: values for key, values in cache["index"].by_category.items() if key[0] in years}
+        changes = [[*key, *values] for key, values in current.items() if stored.get(key) != values]
+        # 내역이 모두 빠진 칸은 0으로 덮어쓴다
+        changes += [[*key, 0, 0, 0, 0] for key, values in stored.items()
+                    if key[0] in years and key not in current and any(values)]
+        if not changes: return
+        persist("monthly", changes)
+        stored.update((tuple(row[:4]), row[4:]) for row in changes)
+    except:
+        # 다음에 저장소에서 다시 읽어서 맞춘다
+        cache["monthly"] = None
+        reset_connection()
+
+def year_totals(df, year):
+    # df 중 year년 내역의 [행 수, 지출, 수입]
+    if df is None or df.empty: return [0, 0, 0]
+    part = df[partition_mask(df, year)]
+    return [len(part), int(part.loc[part['구분'] == '지출', '금액'].sum()), int(part.loc[part['구분'] == '수입', '금액'].sum())]
+
+def sync_catalog(cache, years, added=None, removed=None):
+    # 연도별 시트 저장소의 목록(CATALOG_SHEET)에 있는 행 수/지출/수입을 캐시와 맞춘다 (달라진 연도만 저장)
+    #   - 다 읽어 둔 연도: 캐시의 행 수와 집계 인덱스 합계로 덮어쓴다
+    #   - 아직 읽지 않은 연도에 쓴 경우(patch_ledger): 목록 값에 더하고 뺀 행(added/removed)만큼 고친다
+    # SQLite는 목록을 날짜 인덱스로 바로 계산하므로 할 일이 없다
+    backend = get_backend()
+    if not backend.partitioned or backend.name != "sheets": return
+    parts = cache["parts"]
+    years = sorted({int(y) for y in years})
+    if not years: return
+    try:
+        # 쓰기 대기열에 넣어 둔 값이 있으면 그 값과 비교한다 (아직 목록에 반영되지 않았을 수 있음)
+        stored = {row[0]: row[1:4] for row in backend.catalog()[CATALOG_HEADERS[:4]].values.tolist()}
+        stored.update(cache["catalog_rows"])
+        archived = backend.archived_years()
+        changes = []
+        for year in years:
+            if year in archived: continue
+            if year in parts:
+                expense = income = 0
+                for month in range(1, 13):
+                    totals = cache["index"].month_totals(year, month)
+                    expense, income = expense + totals[0], income + totals[2]
+                values = [int(partition_mask(cache["ledger"], year).sum()), int(expense), int(income)]
+            elif added is not None or removed is not None:
+                plus, minus = year_totals(added, year), year_totals(removed, year)
+                values = [int(a + b - c) for a, b, c in zip(stored.get(year, [0, 0, 0]), plus, minus)]
+            else:
+                continue
+            if stored.get(year) != values: changes.append([year, *values])
+        if not changes: return
+        persist("catalog", changes)
+        cache["catalog_rows"].update((row[0], row[1:]) for row in changes)
+    except:
+        # 다음에 읽거나 쓸 때 다시 맞춘다
+        reset_connection()
+
+def is_closed(year):
+    return datetime.now() >= datetime(year + 1, 1, 1) + timedelta(days=ARCHIVE_GRACE_DAYS)
+
+def year_summary(df):
+    # 한 해 내역의 (연, 월, 카테고리, 사용자)별 합계 (SUMMARY_HEADERS)
+    index = AggregateIndex(df)
+    rows = [[*key, *values] for key, values in sorted(index.by_category.items())]
+    return numeric_frame(rows, SUMMARY_HEADERS, text=('카테고리', '사용자'))
+
+def archive_year(backend, year, df):
+    summary = year_summary(df)
+    backend.archive_year(year, summary, len(df), summary['지출'].sum(), summary['수입'].sum())
+
+def archive_closed_years(cache):
+    # 유예 기간(ARCHIVE_GRACE_DAYS)이 지난 연도를 보관 처리한다. 하루에 한 번만 확인한다
+    backend = get_backend()
+    today = datetime.now().date()
+    if not backend.partitioned or cache["archive_checked"] == today or has_pending_writes(): return
+    cache["archive_checked"] = today
+    for year in partition_keys(None):
+        if year in backend.archived_years() or not is_closed(year): continue
+        load_partition(cache, year)
+        if year not in cache["parts"]: continue
         try:
-            sheet = client.open(SPREADSHEET_NAME).worksheet("고정지출")
+            archive_year(backend, year, cache["ledger"][partition_mask(cache["ledger"], year)])
+            cache["parts"][year]["archived"] = True
         except:
-            sheet = client.open(SPREADSHEET_NAME).add_worksheet(title="고정지출", rows=100, cols=10)
-            sheet.append_row(FIXED_HEADERS)
-            return pd.DataFrame(columns=FIXED_HEADERS)
+            # 다음 날 다시 시도한다
+            reset_connection()
+
+MIGRATE_CHUNK = 5000
+
+def migrate_to_partitions(dry_run=False, log=print):
+    # sheet1 하나에 쌓인 가계부를 연도별 시트로 나눠 옮기고, 유예 기간이 지난 연도는 바로 보관 처리한다
+    # sheet1은 지우지 않으므로 확인한 뒤 직접 비우면 된다. 이미 목록에 있는 연도는 건너뛴다 (다시 실행해도 안전)
+    source, target = SheetsBackend(), PartitionedSheetsBackend()
+    raw = source.read_ledger()
+    df, bad = parse_ledger(raw)
+    existing = set(target.catalog()['연도'].tolist())
+    log(f"sheet1: {len(raw):,}행 (읽지 못한 행 {len(bad):,}건)")
+    for year in sorted(df['날짜'].dt.year.unique().tolist()):
+        part = df[partition_mask(df, year)]
+        if year in existing:
+            log(f"{year}년: 이미 옮겨져 있어 건너뜀")
+            continue
+        log(f"{year}년: {len(part):,}건 → {partition_title(year)}" + (" (보관)" if is_closed(year) else ""))
+        if dry_run: continue
+        rows = part.assign(날짜=part['날짜'].dt.strftime('%Y-%m-%d')).astype({col: str for col, _ in CATEGORY_COLUMNS})
+        rows = rows[HEADERS].values.tolist()
+        sheet = target.sheet(partition_title(year))
+        target.check_header(partition_title(year))
+        for start in range(0, len(rows), MIGRATE_CHUNK):
+            sheet.append_rows(rows[start:start + MIGRATE_CHUNK])
+        summary = year_summary(part)
+        target.write_catalog(year, len(part), summary['지출'].sum(), summary['수입'].sum())
+        if is_closed(year): archive_year(target, year, part)
+    if len(bad):
+        log(f"날짜/금액을 읽을 수 없는 {len(bad):,}건은 옮기지 않았습니다 (sheet1에 그대로 있음)")
+    return df, bad
+
+def start_ledger(cache):
+    # 가계부 캐시를 빈 상태로 시작한다. 연도별 저장소면 연도 목록과 보관 요약을 먼저 읽는다 (연결할 수 없으면 예외)
+    backend = get_backend()
+    summary = None
+    if backend.partitioned:
+        backend.catalog(refresh=True)
+        if backend.archived_years(): summary = backend.read_summary()
+    cache.update(ledger=empty_ledger(), index=AggregateIndex(), positions=None, parts={}, monthly=None)
+    if summary is not None: cache["index"].apply_summary(summary)
+    cache["version"] += 1
+
+@timed("get_data")
+def get_data(years=None):
+    # years: 필요한 연도들 (연도별 저장소일 때만 의미가 있다). None이면 전부, ()이면 이미 읽은 것만 갱신
+    # 돌려주는 프레임에는 지금까지 읽어 둔 모든 연도가 들어 있으므로 쓰는 쪽에서 기간으로 걸러서 쓴다
+    cache = get_frame_cache()
+    with cache["lock"]:
+        if cache["snapshot"] is not None:
+            # 스냅샷을 보여주는 중에는 저장소를 읽지 않는다 (백그라운드에서 읽는 중이거나 연결이 안 됨)
+            retry_refresh(cache)
+            return cache["ledger"]
+        if cache["ledger"] is None:
+            # 프로세스를 막 띄웠으면 저장해 둔 스냅샷으로 먼저 보여주고 저장소는 백그라운드에서 읽는다
+            if cache["version"] == 0 and open_snapshot(cache, years): return cache["ledger"]
+            try:
+                start_ledger(cache)
+            except Exception as e:
+                if not is_storage_error(e): raise
+                reset_connection()
+                cache["offline"] = cache["offline"] or time.time()
+                return cache["ledger"] if open_snapshot(cache, years) else empty_ledger()
+        try:
+            keys = partition_keys(years, cache["parts"])
+            ok = all([load_partition(cache, key) for key in keys])
+        except Exception as e:
+            # 연결/인증/API 에러만 오프라인으로 본다. 파싱이나 동기화 버그는 읽기 전용 안내로 덮지 않고 그대로 보여준다
+            if not is_storage_error(e): raise
+            reset_connection()
+            ok = False
+        cache["offline"] = None if ok else cache["offline"] or time.time()
+        # 처음부터 아무것도 읽지 못했으면 빈 가계부 대신 스냅샷을 보여준다
+        if not ok and not cache["parts"] and open_snapshot(cache, years): return cache["ledger"]
+        archive_closed_years(cache)
+        save_snapshot(cache)
+        return cache["ledger"]
+
+def get_load_report():
+    # 사이드바 표시용: 정상 행 수, 읽지 못한 행, 메모리 사용량(바이트), 읽어 둔 연도, 연도별 목록
+    df = get_data(())
+    cache = get_frame_cache()
+    parts = dict(cache["parts"])
+    bad = [part["bad_rows"] for part in parts.values() if not part["bad_rows"].empty]
+    try:
+        catalog = get_backend().catalog()
+    except:
+        catalog = pd.DataFrame(columns=CATALOG_HEADERS)
+    return {"rows": len(df), "bad_rows": pd.concat(bad, ignore_index=True) if bad else pd.DataFrame(columns=HEADERS),
+            "memory": int(df.memory_usage(deep=True).sum()), "years": sorted(k for k in parts if k is not None),
+            "catalog": catalog}
+
+def get_positions():
+    # 캐시된 가계부의 ID → 행 위치(0부터) 사전. 프레임이 바뀔 때만 다시 만든다
+    cache = get_frame_cache()
+    with cache["lock"]:
+        if cache["positions"] is None:
+            df = cache["ledger"] if cache["ledger"] is not None else pd.DataFrame(columns=HEADERS)
+            cache["positions"] = dict(zip(df['ID'], range(len(df))))
+        return cache["positions"]
+
+def get_data_version(years=()):
+    # 캐시된 가계부가 바뀔 때마다 1씩 올라가는 번호 (분석 결과 캐시의 키로 쓴다)
+    get_data(years)
+    return get_frame_cache()["version"]
+
+def get_index(years=()):
+    get_data(years)
+    return get_frame_cache()["index"]
+
+@timed("get_fixed_data")
+def get_fixed_data():
+    cache = get_frame_cache()
+    with cache["lock"]:
+        stale = time.monotonic() - cache["fixed_at"] > CACHE_TTL and not has_pending_writes() and cache["snapshot"] is None
+        if cache["fixed"] is None or stale:
+            df = load_fixed()
+            if df is None:
+                # 읽지 못했으면 갖고 있던 것(스냅샷 포함)을 그대로 보여준다
+                cache["offline"] = cache["offline"] or time.time()
+                return cache["fixed"] if cache["fixed"] is not None else pd.DataFrame(columns=FIXED_HEADERS)
+            cache["fixed"] = df
+            cache["fixed_at"] = time.monotonic()
+            # 등록 기록도 고정 항목과 같은 주기로 다시 읽는다 (cron이 등록했을 수 있음)
+            cache["postings"] = None
+            save_snapshot(cache, force=True)
+        return cache["fixed"]
+
+def get_postings(refresh=False):
+    cache = get_frame_cache()
+    with cache["lock"]:
+        if refresh or cache["postings"] is None:
+            try:
+                cache["postings"] = get_backend().read_postings()
+            except:
+                reset_connection()
+                return pd.DataFrame(columns=POSTING_HEADERS)
+        return cache["postings"]
+
+# --- 로컬 스냅샷(snapshot) ---
+# 저장소에서 다 읽어 온 가계부/고정지출 프레임을 SNAPSHOT_DIR에 압축하지 않은 Arrow 파일로 저장해 둔다 (구글 시트 저장소만)
+#   - 프로세스를 새로 띄우면 스냅샷 파일을 읽어 화면을 먼저 그리고, 시트는 백그라운드 스레드가 처음부터 다시 읽어서 바꿔 넣는다
+#   - 시트에 연결할 수 없으면 스냅샷을 그대로 보여주는 읽기 전용(오프라인) 모드가 된다. SNAPSHOT_RETRY초마다 다시 연결해 본다
+#   - 스냅샷을 보여주거나 연결이 끊긴 동안에는 저장/삭제/등록을 막는다 (check_online)
+#   - 저장은 저장소와 맞춰진 뒤(저장 대기 중인 쓰기가 없을 때), 내용이 바뀌었으면 SNAPSHOT_INTERVAL초에 한 번만 한다
+# 스냅샷에는 가계부 내용이 그대로 들어 있다. snapshot_dir을 ""로 두면 끈다
+
+SNAPSHOT_DIR = get_config("snapshot_dir", ".snapshot")
+SNAPSHOT_INTERVAL = get_config("snapshot_interval", 10)
+SNAPSHOT_RETRY = get_config("snapshot_retry", 60)
+SNAPSHOT_WAIT = get_config("snapshot_wait", 30)
+
+def snapshot_enabled():
+    # SQLite는 이미 로컬 파일이라 스냅샷이 필요 없다
+    return bool(SNAPSHOT_DIR) and STORAGE_BACKEND == "sheets"
+
+def snapshot_source():
+    # 다른 스프레드시트나 저장 방식으로 만든 스냅샷은 쓰지 않는다
+    return f"{STORAGE_BACKEND}:{SPREADSHEET_NAME}:{'partitioned' if PARTITION_BY_YEAR else 'sheet1'}"
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.arrow")
+
+def write_arrow(path, df, meta=None):
+    # 임시 파일에 다 쓴 뒤 바꿔치기해서, 읽는 쪽이 쓰다 만 파일을 보지 않게 한다
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if meta is not None:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"snapshot": json.dumps(meta).encode()})
+    tmp = f"{path}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+def read_arrow(path):
+    # → (프레임, 메타). 메모리 맵으로 열어서 읽기용 버퍼를 따로 두지 않는다. to_pandas()에서는 pandas 배열로 한 번 복사된다
+    import pyarrow as pa
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+        meta = (table.schema.metadata or {}).get(b"snapshot")
+        return table.to_pandas(), json.loads(meta) if meta else None
+
+@timed("save_snapshot")
+def save_snapshot(cache, force=False):
+    # 저장소에서 읽은 그대로일 때만 저장한다. 실패해도 화면에는 영향이 없다 (다음 기회에 다시 저장)
+    if not snapshot_enabled() or cache["ledger"] is None or cache["snapshot"] is not None or cache["offline"] is not None: return
+    # 가계부는 version, 고정지출은 프레임을 통째로 바꾸므로 id로 바뀌었는지 본다
+    saved_version = (cache["version"], id(cache["fixed"]))
+    if saved_version == cache["saved_version"] or has_pending_writes(): return
+    if not force and time.monotonic() - cache["saved_at"] < SNAPSHOT_INTERVAL: return
+    cache.update(saved_version=saved_version, saved_at=time.monotonic())
+    meta = {"source": snapshot_source(), "saved_at": time.time(), "years": sorted(k for k in cache["parts"] if k is not None)}
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        if cache["fixed"] is not None: write_arrow(snapshot_path("fixed"), cache["fixed"])
+        write_arrow(snapshot_path("ledger"), cache["ledger"], meta)
+    except:
+        pass
 
-        data = sheet.get_all_records()
-        if not data: return pd.DataFrame(columns=FIXED_HEADERS)
-        return pd.DataFrame(data)
+@timed("load_snapshot")
+def load_snapshot():
+    # 저장해 둔 스냅샷 → (가계부, 고정지출(없으면 None), 메타). 없거나 읽을 수 없거나 다른 저장소의 것이면 None
+    if not snapshot_enabled(): return None
+    try:
+        ledger, meta = read_arrow(snapshot_path("ledger"))
+        if not meta or meta.get("source") != snapshot_source(): return None
+        fixed = read_arrow(snapshot_path("fixed"))[0] if os.path.exists(snapshot_path("fixed")) else None
+        return conform_ledger(ledger), fixed, meta
     except:
-        return pd.DataFrame(columns=FIXED_HEADERS)
+        return None
+
+def open_snapshot(cache, years):
+    # 캐시를 스냅샷으로 채우고 백그라운드 새로 읽기를 시작한다 (이미 연결이 안 되는 걸 알면 SNAPSHOT_RETRY 뒤에)
+    # 아직 저장되지 않은 쓰기가 있으면 스냅샷에는 그 내용이 없으므로 쓰지 않는다
+    if has_pending_writes(): return False
+    snapshot = load_snapshot()
+    if snapshot is None: return False
+    ledger, fixed, meta = snapshot
+    cache.update(ledger=ledger, index=AggregateIndex(ledger), positions=None, parts={}, monthly=None, snapshot=meta)
+    cache["version"] += 1
+    if fixed is not None and cache["fixed"] is None:
+        cache.update(fixed=fixed, fixed_at=time.monotonic(), postings=None)
+    # 스냅샷에 있던 연도와 지금 요청한 연도를 같이 읽는다
+    meta["wanted"] = None if years is None else sorted(set(meta["years"]) | {int(y) for y in years})
+    if cache["offline"] is not None:
+        cache["refresh_at"] = time.monotonic()
+    else:
+        start_refresh(cache)
+    return True
+
+def start_refresh(cache):
+    thread = threading.Thread(target=refresh_from_backend, args=(cache,), name="snapshot-refresh", daemon=True)
+    cache.update(refresh=thread, refresh_at=time.monotonic())
+    thread.start()
+
+def retry_refresh(cache, now=False):
+    # 연결이 안 되는 동안 SNAPSHOT_RETRY초마다 (now면 바로) 다시 읽어 본다
+    if cache["snapshot"] is None or cache["refresh"] is not None: return
+    if now or time.monotonic() - cache["refresh_at"] > SNAPSHOT_RETRY:
+        start_refresh(cache)
+
+@timed("refresh_from_backend")
+def refresh_from_backend(cache):
+    # 스냅샷을 보여주는 동안 저장소를 새 캐시(state)에 처음부터 읽고, 다 읽으면 캐시 락을 잡고 한 번에 바꿔 넣는다
+    # 읽는 동안에는 락을 잡지 않으므로 화면은 스냅샷으로 계속 그려진다
+    state = {"ledger": None, "index": None, "positions": None, "parts": {}, "version": 0, "monthly": None, "catalog_rows": {}}
+    fixed = None
+    try:
+        start_ledger(state)
+        keys = partition_keys(cache["snapshot"]["wanted"])
+        ok = all([load_partition(state, key) for key in keys])
+        if ok: fixed = load_fixed()
+    except Exception as e:
+        if not is_storage_error(e):
+            # 연결 문제가 아니면 스냅샷을 내려놓는다. 다음 get_data()가 저장소를 직접 읽으면서 같은 에러를 화면에 보여준다
+            with cache["lock"]:
+                cache.update(refresh=None, snapshot=None, ledger=None, monthly=None, catalog_rows={})
+            raise
+        reset_connection()
+        ok = False
+    with cache["lock"]:
+        cache["refresh"] = None
+        if not ok or fixed is None:
+            cache["offline"] = cache["offline"] or time.time()
+            return
+        cache.update(ledger=state["ledger"], index=state["index"], positions=None, parts=state["parts"], monthly=state["monthly"],
+                     fixed=fixed, fixed_at=time.monotonic(), postings=None, snapshot=None, offline=None)
+        cache["version"] += 1
+        save_snapshot(cache, force=True)
+
+def check_online():
+    # 스냅샷을 보여주거나 저장소에 연결이 안 되는 동안에는 쓰지 않는다 → ValueError
+    # 백그라운드에서 새로 읽는 중이면 끝날 때까지 SNAPSHOT_WAIT초 기다려 본다
+    cache = get_frame_cache()
+    refresh = cache["refresh"]
+    if refresh is not None: refresh.join(SNAPSHOT_WAIT)
+    if cache["snapshot"] is not None or cache["offline"] is not None:
+        raise ValueError("구글 시트에 연결할 수 없어 읽기 전용 모드입니다. 연결된 뒤에 다시 시도해주세요.")
+
+def is_read_only():
+    cache = get_frame_cache()
+    return cache["snapshot"] is not None or cache["offline"] is not None
+
+def reconnect():
+    # 새로고침/다시 연결 버튼: 스냅샷을 보여주는 중이면 바로 다시 읽기 시작, 아니면 캐시를 비워서 다음 실행에서 읽는다
+    cache = get_frame_cache()
+    with cache["lock"]:
+        retry_refresh(cache, now=True)
+    invalidate_cache()
+
+# --- 쓰기 대기열(write-behind) ---
+# write_behind 설정을 켜면 쓰기는 캐시에 먼저 반영하고(낙관적 반영) 저장소에는 백그라운드 스레드가 저장한다
+#   - 연달아 들어온 같은 종류의 쓰기(추가/수정/삭제)는 요청 하나로 합친다
+#   - 할당량(429)/서버 오류/네트워크 오류는 지수 백오프로 WRITE_RETRIES번까지 다시 시도한다
+#   - 대기열은 프로세스 전체에서 공유하므로 화면이 다시 실행(rerun)되어도 사라지지 않는다
+
+def run_write(kind, payload):
+    # 실제로 저장소에 쓰고, 그동안 보낸 API 요청 수(count_api로 센 값)를 돌려준다
+    backend = get_backend()
+    before = api_calls()
+    if kind == "append":
+        backend.append_rows(payload)
+    elif kind == "append_fixed":
+        backend.append_rows(payload, fixed=True)
+    elif kind == "update":
+        backend.update_cells(payload)
+    elif kind == "delete":
+        backend.delete_rows(payload)
+    elif kind == "delete_fixed":
+        backend.delete_rows(payload, fixed=True)
+    elif kind == "monthly":
+        backend.write_monthly(payload)
+    elif kind == "postings":
+        backend.append_postings(payload)
+    elif kind == "catalog":
+        for values in payload:
+            backend.write_catalog(*values)
+    else:
+        raise ValueError(f"알 수 없는 쓰기 종류: {kind}")
+    return api_calls() - before
+
+def is_retryable(error):
+    # gspread를 아직 불러오지 않았다면(SQLite 저장소) 시트 API 에러일 수 없다
+    gspread = sys.modules.get("gspread")
+    if gspread is not None and isinstance(error, gspread.exceptions.APIError):
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+        return status == 429 or (status is not None and status >= 500)
+    return isinstance(error, (ConnectionError, TimeoutError, OSError))
+
+def is_storage_error(error):
+    # 저장소에 닿지 못해서 난 에러인지 (네트워크, 인증, 시트 API, SQLite). 오프라인으로 볼지 정할 때 쓴다
+    if isinstance(error, (StorageUnavailable, OSError, sqlite3.Error)): return True
+    for module, name in (("gspread.exceptions", "GSpreadException"), ("google.auth.exceptions", "GoogleAuthError"), ("oauth2client.client", "Error")):
+        base = getattr(sys.modules.get(module), name, None)
+        if base is not None and isinstance(error, base): return True
+    return False
 
-def add_row(date, type_, user, category, item, amount):
-    client = get_client()
-    sheet = client.open(SPREADSHEET_NAME).sheet1
-    if not sheet.row_values(1): sheet.append_row(HEADERS)
-    sheet.append_row([str(date), type_, user, category, item, int(amount)])
+class WriteQueue:
+    labels = {"append": "추가", "append_fixed": "고정 항목 추가", "update": "수정", "delete": "삭제", "delete_fixed": "고정 항목 삭제",
+              "monthly": "월별 요약", "postings": "고정 지출 기록",
+              "catalog": "연도별 목록"}
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = collections.deque()   # [(kind, payload)]
+        self.failed = []                     # [(kind, payload, 에러 메시지)]
+        self.worker = threading.Thread(target=self.run, name="write-behind", daemon=True)
+        self.worker.start()
+
+    def wait_idle(self, timeout):
+        # 대기열이 빌 때까지(마지막 쓰기가 끝날 때까지) 기다린다. 시간 안에 비면 True
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending, timeout)
+
+    def submit(self, kind, payload):
+        with self.cond:
+            self.pending.append((kind, payload))
+            self.cond.notify()
+
+    def take_batch(self):
+        # 맨 앞에서부터 같은 종류의 쓰기를 모아서 하나로 합친다 → (종류, 합친 내용, 합친 개수)
+        kind = self.pending[0][0]
+        count = 0
+        for k, _ in self.pending:
+            if k != kind: break
+            count += 1
+        payloads = [p for _, p in list(self.pending)[:count]]
+        if kind == "update":
+            # 같은 칸을 여러 번 고쳤으면 마지막 값만 보낸다
+            merged = {}
+            for changes in payloads:
+                for row_id, col_name, value in changes:
+                    merged[(row_id, col_name)] = value
+            return kind, [(row_id, col_name, value) for (row_id, col_name), value in merged.items()], count
+        if kind in ("delete", "delete_fixed"):
+            return kind, list(dict.fromkeys(i for ids in payloads for i in ids)), count
+        return kind, [row for rows in payloads for row in rows], count
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                kind, payload, count = self.take_batch()
+            error = None
+            for attempt in range(WRITE_RETRIES):
+                try:
+                    run_write(kind, payload)
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    if not is_retryable(e): break
+                    time.sleep(min(2 ** attempt, 32))
+            with self.cond:
+                for _ in range(count):
+                    self.pending.popleft()
+                self.cond.notify_all()
+                if error is not None:
+                    self.failed.append((kind, payload, str(error)))
+            if error is not None:
+                # 캐시에 먼저 반영했던 내용이 저장소와 달라졌으므로 다음 화면에서 다시 읽게 한다
+                invalidate_cache()
+
+    def retry_failed(self):
+        with self.cond:
+            failed, self.failed = self.failed, []
+            for kind, payload, _ in failed:
+                self.pending.append((kind, payload))
+            self.cond.notify()
+
+    def discard_failed(self):
+        with self.cond:
+            self.failed = []
+
+    def status(self):
+        with self.cond:
+            return [k for k, _ in self.pending], list(self.failed)
+
+@st.cache_resource(show_spinner=False)
+def get_write_queue():
+    return WriteQueue()
+
+def has_pending_writes():
+    return WRITE_BEHIND and bool(get_write_queue().pending)
+
+def persist(kind, payload):
+    # write_behind면 대기열에 넣고 바로 돌아온다(요청 수 0), 아니면 바로 저장하고 요청 수를 돌려준다
+    if WRITE_BEHIND:
+        get_write_queue().submit(kind, payload)
+        return 0
+    return run_write(kind, payload)
+
+def count_rows(cache, frame, sign):
+    # 캐시에 더하거나 뺀 행 수를 파티션별 원본 행 수(증분 동기화 기준)에 반영한다
+    if frame is None or frame.empty: return
+    if None in cache["parts"]:
+        cache["parts"][None]["raw_rows"] += sign * len(frame)
+        return
+    for year, n in frame['날짜'].dt.year.value_counts().items():
+        if year in cache["parts"]: cache["parts"][year]["raw_rows"] += sign * int(n)
+
+def cached_years(row_ids):
+    # 캐시에 있는 내역들의 연도 (보관된 연도를 고치려는지 확인용)
+    df = get_frame_cache()["ledger"]
+    positions = get_positions()
+    rows = [positions[i] for i in row_ids if i in positions]
+    return set(df['날짜'].iloc[rows].dt.year.tolist()) if rows else set()
+
+def patch_ledger(func):
+    # 캐시된 프레임을 복사본으로 고친 뒤 교체 (다른 세션이 읽는 중인 프레임은 건드리지 않음)
+    # func(df)는 (새 프레임, 빠진 행들, 추가된 행들)을 돌려주고, 집계 인덱스는 그 차이만큼만 갱신한다
+    cache = get_frame_cache()
+    with cache["lock"]:
+        if cache["ledger"] is not None:
+            df, removed, added = func(cache["ledger"])
+            cache["ledger"] = conform_ledger(df)
+            cache["positions"] = None
+            cache["version"] += 1
+            count_rows(cache, added, 1)
+            count_rows(cache, removed, -1)
+            cache["index"].apply(removed, -1)
+            cache["index"].apply(added)
+            touched = [frame['날짜'].dt.year for frame in (removed, added) if frame is not None and not frame.empty]
+            if touched:
+                years = pd.concat(touched).unique().tolist()
+                sync_monthly(cache, years)
+                sync_catalog(cache, years, added, removed)
 
+def add_row(date, type_, user, category, item, amount):
+    add_rows([(date, type_, user, category, item, amount)])
+
+@timed("add_rows")
+def add_rows(rows, ids=None):
+    # 여러 행을 한 번의 요청(append_rows)으로 추가. ids를 주면 새 ID 대신 그 ID를 쓴다
+    if not rows: return 0
+    check_online()
+    check_writable(get_backend(), [year_of(row[0]) for row in rows])
+    ids = ids or [new_id() for _ in rows]
+    values = [[str(date), type_, user, category, item, int(amount), row_id]
+              for (date, type_, user, category, item, amount), row_id in zip(rows, ids)]
+    persist("append", values)
+    new_df, _ = parse_ledger(pd.DataFrame(values, columns=HEADERS))
+    patch_ledger(lambda df: (new_df if df.empty else pd.concat([df, new_df], ignore_index=True), None, new_df))
+    return len(values)
+
+# --- 고정 지출 자동 등록 ---
+# 고정 항목을 달마다 한 번씩만 가계부에 등록하고, 등록한 (항목 ID, 달)을 POSTING_SHEET(SQLite는 postings 테이블)에 남긴다
+#   - 항목마다 처음 등록한 달부터 이번 달까지 중 기록이 없고 일자가 지난 달을 모두 등록한다 (최대 FIXED_BACKFILL_MONTHS개월)
+#     미래 달을 손으로 먼저 등록했거나 중간에 빠진 달이 있어도 그 앞의 달을 채운다
+#   - 기록이 없는 새 항목은 이번 달부터 시작한다 (만들기 전 달은 등록하지 않음)
+#   - 가계부에 같은 내역이 이미 있으면(예전처럼 손으로 적용한 경우) 새로 쓰지 않고 기록만 남긴다
+#   - 등록할 내역은 모두 모아서 한 번에 추가하고, 기록도 한 번에 저장한다
+# 고정 지출 화면의 버튼이나 post_fixed.py(cron용)로 실행한다. 화면을 그리는 중에 저절로 등록하지는 않는다
+# 앱과 cron이 같은 서버에서 동시에 등록하지 않도록 잠금 파일(POSTING_LOCK_FILE)을 잡고, 잡은 뒤에 기록과 가계부를 다시 읽어서 확인한다
+# (시트의 기록에는 중복을 막는 장치가 없으므로 다른 서버에서 같은 시트에 등록하는 경우는 막지 못한다)
+
+FIXED_BACKFILL_MONTHS = get_config("fixed_backfill_months", 12)
+POSTING_LOCK_FILE = get_config("posting_lock_file", ".post_fixed.lock")
+
+def fixed_row(row, year, month):
+    # 고정 항목 하나 → year년 month월의 가계부 행 (날짜, 구분, 사용자, 카테고리, 내역, 금액). 일자가 그 달에 없으면 말일
+    target_day = min(max(int(row['일자']), 1), calendar.monthrange(year, month)[1])
+    amount = clean_cell('금액', row['금액'])
+    return (f"{year:04d}-{month:02d}-{target_day:02d}", str(row['구분']), str(row['사용자']),
+            str(row['카테고리']), str(row['내역']), int(amount))
+
+def month_keys(ledger_df, year, month):
+    # 가계부의 year년 month월 내역을 fixed_row와 같은 모양으로 센다 (이미 들어가 있는 고정 지출 찾기용)
+    existing = collections.Counter()
+    if not ledger_df.empty:
+        month_df = month_frame(ledger_df, year, month)
+        existing.update(zip(month_df['날짜'].dt.strftime('%Y-%m-%d'), month_df['구분'].astype(str), month_df['사용자'].astype(str),
+                            month_df['카테고리'].astype(str), month_df['내역'].astype(str), month_df['금액'].astype(int)))
+    return existing
+
+def due_fixed(fixed_df, postings, today, months=None):
+    # → (등록할 차례인 (고정 항목, 연, 월) 목록, 이미 등록 기록이 있어 건너뛴 수, 에러 메시지)
+    # months([(연, 월)])를 주면 그 달들만 본다
+    posted = set(zip(postings['항목ID'], postings['월']))
+    this_month = pd.Period(today, 'M')
+    earliest = this_month - (FIXED_BACKFILL_MONTHS - 1)
+    due, already, errors = [], 0, []
+    for row in fixed_df.to_dict('records'):
+        if months is not None:
+            candidates = [pd.Period(year=y, month=m, freq='M') for y, m in months]
+        else:
+            done = postings.loc[postings['항목ID'] == row['ID'], '월']
+            start = min(pd.Period(done.min(), 'M'), this_month) if len(done) else this_month
+            candidates = pd.period_range(max(start, earliest), this_month, freq='M')
+        for period in candidates:
+            if (row['ID'], period.strftime('%Y-%m')) in posted:
+                already += 1
+                continue
+            try:
+                day = fixed_row(row, period.year, period.month)[0]
+            except Exception as e:
+                errors.append(f"{row.get('내역', '')}: {e}")
+                break
+            # 자동 등록은 그 달의 일자가 지난 것만 (손으로 고른 달은 바로)
+            if months is None and day > today.strftime('%Y-%m-%d'): continue
+            due.append((row, period.year, period.month))
+    return due, already, errors
+
+@st.cache_resource(show_spinner=False)
+def get_posting_lock():
+    # 한 프로세스에서 두 명이 동시에 버튼을 눌러도 한 번만 등록되게 한다
+    return threading.Lock()
+
+@contextlib.contextmanager
+def posting_lock():
+    # 프로세스 안에서는 get_posting_lock(), 프로세스 사이(앱과 post_fixed.py)에서는 잠금 파일로 한 번에 하나만 등록한다
+    with get_posting_lock(), open(POSTING_LOCK_FILE, "a+") as f:
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except ImportError:
+            # 윈도우
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+
+def refresh_data(years):
+    # CACHE_TTL을 기다리지 않고 그 연도들을 저장소와 다시 맞춘다 (다른 프로세스가 방금 쓴 내용 확인용)
+    cache = get_frame_cache()
+    with cache["lock"]:
+        for key, part in cache["parts"].items():
+            if key is None or key in years: part["loaded_at"] = float("-inf")
+    return get_data(years)
+
+@timed("post_fixed_expenses")
+def post_fixed_expenses(months=None, today=None, dry_run=False):
+    # 등록할 차례인 고정 지출을 모두 등록한다 → {"rows": 등록한(할) 행, "skipped": 이미 등록됐거나 가계부에 있던 수, "errors": 에러 메시지}
+    # dry_run이면 저장하지 않고 등록할 내용만 돌려준다
+    today = today or datetime.now().date()
+    if not dry_run:
+        # 읽기 전용이면 등록 기록부터 읽을 수 없으므로 바로 돌아간다
+        try:
+            check_online()
+        except ValueError as e:
+            return {"rows": [], "skipped": 0, "errors": [str(e)]}
+    with contextlib.nullcontext() if dry_run else posting_lock():
+        # 잠금을 잡은 뒤에 기록과 가계부를 다시 읽으므로 다른 프로세스가 방금 등록한 내역은 건너뛴다
+        fixed_df = get_fixed_data()
+        postings = get_postings(refresh=not dry_run)
+        due, skipped, errors = due_fixed(fixed_df, postings, today, months)
+        backend = get_backend()
+        years = sorted({year for _, year, _ in due})
+        if not due:
+            ledger = empty_ledger()
+        else:
+            ledger = get_data(years) if dry_run else refresh_data(years)
+        archived = backend.archived_years() if backend.partitioned else set()
+        existing = {}
+        rows, ids, log = [], [], []
+        stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for row, year, month in due:
+            if year in archived:
+                errors.append(f"{row['내역']}: {year}년은 보관된 연도라 등록할 수 없습니다.")
+                continue
+            key = fixed_row(row, year, month)
+            counter = existing.setdefault((year, month), month_keys(ledger, year, month))
+            row_id = ""
+            if counter[key] > 0:
+                counter[key] -= 1
+                skipped += 1
+            else:
+                row_id = new_id()
+                rows.append(key)
+                ids.append(row_id)
+            log.append([str(row['ID']), f"{year:04d}-{month:02d}", row_id, stamp])
+        result = {"rows": rows, "skipped": skipped, "errors": errors}
+        if dry_run or not log: return result
+        # 가계부를 먼저 쓴다. 기록 저장이 실패해도 다음 실행에서 같은 내역을 찾아 기록만 남긴다
+        try:
+            add_rows(rows, ids)
+        except ValueError as e:
+            return {"rows": [], "skipped": skipped, "errors": errors + [str(e)]}
+        persist("postings", log)
+        # 쓰기 대기열을 쓰면 잠금을 놓기 전에 저장소에 다 써야 다음 프로세스가 다시 읽을 때 보인다
+        if WRITE_BEHIND: get_write_queue().wait_idle(60)
+        cache = get_frame_cache()
+        with cache["lock"]:
+            if cache["postings"] is not None:
+                cache["postings"] = pd.concat([cache["postings"], pd.DataFrame(log, columns=POSTING_HEADERS)], ignore_index=True)
+        return result
+
+def apply_fixed_expenses(year, month):
+    # 고른 달에 고정 지출을 등록한다 (이미 등록했거나 가계부에 있는 항목은 건너뜀) → (등록 수, 건너뛴 수, 에러)
+    result = post_fixed_expenses(months=[(year, month)])
+    return len(result["rows"]), result["skipped"], result["errors"]
+
+def patch_fixed(func):
+    cache = get_frame_cache()
+    with cache["lock"]:
+        if cache["fixed"] is not None:
+            cache["fixed"] = func(cache["fixed"])
+
+@timed("add_fixed_row")
 def add_fixed_row(day, type_, user, category, item, amount):
-    client = get_client()
-    sheet = client.open(SPREADSHEET_NAME).worksheet("고정지출")
-    if not sheet.row_values(1): sheet.append_row(FIXED_HEADERS)
-    sheet.append_row([int(day), type_, user, category, item, int(amount)])
-
-def delete_row(row_index):
-    client = get_client()
-    sheet = client.open(SPREADSHEET_NAME).sheet1
-    sheet.delete_rows(row_index + 2)
-
-def delete_fixed_row(row_index):
-    client = get_client()
-    sheet = client.open(SPREADSHEET_NAME).worksheet("고정지출")
-    sheet.delete_rows(row_index + 2)
-
-def update_cell(row_idx, col_name, new_value):
-    client = get_client()
-    sheet = client.open(SPREADSHEET_NAME).sheet1
-    sheet_row = row_idx + 2
-    sheet_col = COL_MAP[col_name]
+    check_online()
+    values = [int(day), type_, user, category, item, int(amount), new_id()]
+    persist("append_fixed", [values])
+    new_df = pd.DataFrame([values], columns=FIXED_HEADERS)
+    patch_fixed(lambda df: new_df if df.empty else pd.concat([df, new_df], ignore_index=True))
+
+@timed("delete_rows")
+def delete_rows(row_ids):
+    # 여러 내역을 ID로 한 번에 삭제
+    row_ids = list(row_ids)
+    if not row_ids: return 0
+    check_online()
+    check_writable(get_backend(), cached_years(row_ids))
+    persist("delete", row_ids)
+    def patch(df):
+        mask = df['ID'].isin(row_ids)
+        return df[~mask].reset_index(drop=True), df[mask], None
+    patch_ledger(patch)
+    return len(row_ids)
+
+def delete_row(row_id):
+    delete_rows([row_id])
+
+@timed("delete_fixed_row")
+def delete_fixed_row(row_id):
+    check_online()
+    persist("delete_fixed", [row_id])
+    patch_fixed(lambda df: df[df['ID'] != row_id].reset_index(drop=True))
+
+def clean_cell(col_name, value):
     if col_name == '금액':
-        try: new_value = int(str(new_value).replace(',', ''))
+        try: return int(float(str(value).replace(',', '')))
         except: pass
-    sheet.update_cell(sheet_row, sheet_col, new_value)
+    # numpy 스칼라는 JSON으로 보낼 수 없으므로 파이썬 기본 타입으로 변환
+    return value.item() if hasattr(value, 'item') else value
+
+def patch_cells(changes):
+    def patch(df):
+        positions = get_positions()
+        rows = sorted({positions[row_id] for row_id, _, _ in changes})
+        before = df.loc[rows]
+        df = df.copy()
+        for row_id, col_name, value in changes:
+            if isinstance(df[col_name].dtype, pd.CategoricalDtype) and value not in df[col_name].cat.categories:
+                df[col_name] = df[col_name].cat.add_categories([value])
+            df.at[positions[row_id], col_name] = pd.to_datetime(value) if col_name == '날짜' else value
+        return df, before, df.loc[rows]
+    try:
+        patch_ledger(patch)
+    except:
+        invalidate_cache(fixed=False)
+
+def update_cell(row_id, col_name, new_value):
+    update_cells([(row_id, col_name, new_value)])
+
+def diff_frames(original, edited):
+    # 원본/수정본 표(인덱스가 ID)를 한 번에 비교해서 바뀐 칸만 (ID, 컬럼, 새 값) 목록으로 돌려준다
+    cols = [c for c in HEADERS if c != 'ID' and c in original.columns and c in edited.columns]
+    if original.empty or not cols: return []
+    after = edited.reindex(index=original.index, columns=cols)
+    changed = (original[cols].astype(str) != after.astype(str)).stack()
+    changed = changed[changed]
+    return [(row_id, col_name, after.at[row_id, col_name]) for row_id, col_name in changed.index]
+
+@timed("update_cells")
+def update_cells(changes):
+    # 바뀐 칸들을 한 번의 요청(batch_update)으로 저장하고 (저장한 칸 수, API 요청 수)를 돌려준다
+    # 요청 수는 행 위치 확인, 연도 목록, 월별 요약 저장까지 이 저장 때문에 실제로 보낸 것을 모두 센다 (write_behind면 0)
+    if not changes: return 0, 0
+    check_online()
+    before = api_calls()
+    changes = [(row_id, col_name, clean_cell(col_name, value)) for row_id, col_name, value in changes]
+    if get_backend().partitioned:
+        check_writable(get_backend(), cached_years([row_id for row_id, _, _ in changes]) |
+                       {year_of(value) for _, col_name, value in changes if col_name == '날짜'})
+    persist("update", changes)
+    patch_cells(changes)
+    return len(changes), 0 if WRITE_BEHIND else api_calls() - before
+
+
+# --- 명세서 가져오기(import) ---
+# 카드/은행 명세서(CSV, 엑셀)를 IMPORT_CHUNK줄씩 읽어서 가계부 행으로 바꾼다
+#   - 컬럼 이름으로 날짜/금액/입금/내역 컬럼을 짐작하고, 화면에서 바꿀 수 있다
+#   - 지출 카테고리는 키워드 규칙(import_rules 설정, 화면에서 수정 가능)으로 정한다
+#   - (날짜, 금액, 내역) 해시로 가계부에 이미 있는 내역을 건너뛴다 (같은 내역이 여러 번이면 개수만큼)
+#   - 새 행은 IMPORT_CHUNK개씩 모아서 append_rows 한 번으로 저장한다
+# 파일 전체를 프레임으로 만들지 않으므로 수만 줄짜리 파일도 한 번에 한 묶음만 메모리에 올라간다
+
+IMPORT_CHUNK = get_config("import_chunk", 2000)
+
+DEFAULT_IMPORT_RULES = {
+    "외식/배달": ["배달의민족", "요기요", "쿠팡이츠", "스타벅스", "커피", "카페", "식당", "치킨", "피자"],
+    "식비": ["마트", "이마트", "홈플러스", "롯데마트", "컬리", "편의점", "GS25", "CU", "세븐일레븐"],
+    "교통": ["택시", "카카오T", "티머니", "코레일", "SRT", "버스", "지하철"],
+    "자동차": ["주유", "충전소", "주차", "하이패스", "세차"],
+    "통신": ["SKT", "KT", "LG U+", "유플러스", "알뜰폰"],
+    "공과금": ["전기", "가스", "수도", "관리비", "한국전력"],
+    "의료/건강": ["병원", "의원", "약국", "치과", "한의원"],
+    "생필품": ["다이소", "올리브영"],
+    "쇼핑": ["쿠팡", "11번가", "G마켓", "옥션", "무신사", "네이버페이"],
+    "미용": ["미용실", "헤어", "네일"],
+    "취미": ["넷플릭스", "유튜브", "CGV", "메가박스", "롯데시네마"],
+}
+
+# 명세서마다 컬럼 이름이 달라서 흔한 이름으로 짐작한다 (앞에 있을수록 우선)
+COLUMN_GUESSES = {
+    "날짜": ["날짜", "거래일자", "거래일", "이용일자", "이용일", "승인일자", "승인일", "일자", "거래일시", "date"],
+    "금액": ["금액", "이용금액", "승인금액", "결제금액", "거래금액", "출금액", "출금", "찾으신금액", "amount"],
+    "입금": ["입금액", "입금", "맡기신금액"],
+    "내역": ["내역", "가맹점명", "가맹점", "이용가맹점", "이용하신곳", "적요", "거래내용", "내용", "description"],
+}
+
+def get_import_rules():
+    # import_rules 설정(카테고리 → 키워드 목록, 환경변수는 JSON)이 있으면 그걸, 없으면 기본 규칙
+    value = os.environ.get("IMPORT_RULES")
+    try:
+        rules = json.loads(value) if value else dict(st.secrets.get("import_rules", {}))
+    except:
+        rules = {}
+    return {cat: list(words) for cat, words in rules.items()} or DEFAULT_IMPORT_RULES
+
+def rules_to_text(rules):
+    return "\n".join(f"{cat}: {', '.join(words)}" for cat, words in rules.items())
+
+def parse_rules(text):
+    # "카테고리: 키워드, 키워드" 줄들 → ([(키워드, 카테고리)], 에러 메시지 목록). 위에 있는 규칙이 우선
+    rules, errors = [], []
+    for line in text.splitlines():
+        if not line.strip(): continue
+        cat, _, words = line.partition(":")
+        cat = cat.strip()
+        if cat not in EXPENSE_CATS:
+            errors.append(f"알 수 없는 카테고리라 무시합니다: {cat}")
+            continue
+        rules += [(word.strip(), cat) for word in words.split(",") if word.strip()]
+    return rules, errors
+
+def categorize(items, rules):
+    # 내역에 키워드가 들어 있으면 그 카테고리, 없으면 기타 (앞쪽 규칙이 우선)
+    # 같은 가맹점이 여러 번 나오므로 서로 다른 내역만 한 번씩 규칙과 맞춰 본다
+    lowered = [(word.lower(), cat) for word, cat in rules]
+    found = {item: next((cat for word, cat in lowered if word in str(item).lower()), "기타") for item in items.unique()}
+    return items.map(found)
+
+def guess_columns(columns):
+    # {날짜/금액/입금/내역: 명세서 컬럼 이름 또는 None}. 이름이 같은 컬럼을 먼저, 없으면 이름이 들어간 컬럼
+    names = [str(c).strip() for c in columns]
+    guessed = {}
+    for field, candidates in COLUMN_GUESSES.items():
+        exact = [c for cand in candidates for c in names if c.lower() == cand.lower()]
+        partial = [c for cand in candidates for c in names if cand.lower() in c.lower()]
+        found = [c for c in exact + partial if c not in guessed.values()]
+        guessed[field] = found[0] if found else None
+    return guessed
+
+def detect_encoding(file):
+    # 국내 은행/카드사 CSV는 cp949가 많다. 앞부분이 UTF-8로 읽히면 UTF-8로 본다
+    sample = file.read(65536)
+    file.seek(0)
+    try:
+        codecs.getincrementaldecoder("utf-8-sig")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp949"
+
+def read_statement(file, name, skip_rows=0, chunk=IMPORT_CHUNK):
+    # 명세서를 chunk줄씩 문자열 프레임으로 읽는다 → (프레임, 진행률 0~1)
+    file.seek(0)
+    if name.lower().endswith((".xlsx", ".xlsm")):
+        try:
+            import openpyxl
+        except ImportError:
+            raise RuntimeError("엑셀 파일을 읽으려면 openpyxl을 설치해야 합니다. (CSV로 저장해서 올려도 됩니다)")
+        book = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            sheet = book.active
+            total = sheet.max_row or 0
+            rows = sheet.iter_rows(values_only=True)
+            for _ in range(skip_rows): next(rows, None)
+            header = [f"열{i + 1}" if c is None else str(c).strip() for i, c in enumerate(next(rows, None) or [])]
+            batch, done = [], skip_rows + 1
+            for row in rows:
+                row = ["" if v is None else str(v) for v in row[:len(header)]]
+                batch.append(row + [""] * (len(header) - len(row)))
+                done += 1
+                if len(batch) >= chunk:
+                    yield pd.DataFrame(batch, columns=header), done / total if total else 0.0
+                    batch = []
+            if batch: yield pd.DataFrame(batch, columns=header), 1.0
+        finally:
+            book.close()
+        return
+    size = max(file.seek(0, os.SEEK_END), 1)
+    file.seek(0)
+    # pandas가 파일을 닫지 않도록 직접 텍스트로 감싸고, 다 읽으면 떼어 낸다 (미리보기 후 다시 읽어야 하므로)
+    text = io.TextIOWrapper(file, encoding=detect_encoding(file), newline="")
+    try:
+        for df in pd.read_csv(text, skiprows=skip_rows, dtype=str, chunksize=chunk, skipinitialspace=True, keep_default_na=False):
+            df.columns = [str(c).strip() for c in df.columns]
+            yield df, file.tell() / size
+    finally:
+        text.detach()
+
+def money(values):
+    # "1,234원", " -5,000 " 같은 금액 문자열 → 숫자 (읽을 수 없으면 0)
+    return pd.to_numeric(values.astype(str).str.replace(r"[,원\s]", "", regex=True), errors='coerce').fillna(0)
+
+def normalize_statement(chunk, mapping, user, rules):
+    # 명세서 한 묶음 → (날짜/구분/사용자/카테고리/내역/금액 프레임, 버린 줄 수)
+    # 입금이 있거나 금액이 음수(취소/환불)인 줄은 수입 '기타'로 넣는다
+    dates = pd.to_datetime(chunk[mapping["날짜"]].astype(str).str.strip(), format='mixed', errors='coerce').dt.normalize()
+    spent = money(chunk[mapping["금액"]]) if mapping.get("금액") else pd.Series(0.0, index=chunk.index)
+    received = money(chunk[mapping["입금"]]) if mapping.get("입금") else pd.Series(0.0, index=chunk.index)
+    income = (received > 0) | (spent < 0)
+    amounts = received.where(received > 0, spent.abs()).round()
+    items = chunk[mapping["내역"]].astype(str).str.strip()
+    ok = dates.notna() & (amounts > 0)
+    df = pd.DataFrame({
+        '날짜': dates[ok].astype('datetime64[ns]'),
+        '구분': np.where(income[ok], '수입', '지출'),
+        '사용자': user,
+        '카테고리': np.where(income[ok], '기타', categorize(items[ok], rules)),
+        '내역': items[ok],
+        '금액': amounts[ok].astype('int64'),
+    }).reset_index(drop=True)
+    return df, int((~ok).sum())
+
+def dedup_hashes(df):
+    # (날짜, 금액, 내역) → 64비트 해시 목록. 가계부와 명세서를 같은 방식으로 정규화해서 비교한다
+    if df.empty: return []
+    frame = pd.DataFrame({
+        'd': df['날짜'].dt.strftime('%Y-%m-%d').to_numpy(),
+        'a': df['금액'].astype('int64').to_numpy(),
+        'i': df['내역'].astype(str).str.strip().to_numpy(),
+    })
+    return pd.util.hash_pandas_object(frame, index=False).tolist()
+
+@timed("import_statement")
+def import_statement(file, name, mapping, user, rules, skip_rows=0, write=True, limit=None, progress=None):
+    # 명세서를 끝까지 읽으며 IMPORT_CHUNK개씩 저장한다. write=False면 앞 limit줄만 처리해서 미리보기 프레임을 돌려준다
+    # progress(진행률, 통계)는 묶음마다 불린다. 돌려주는 값: {added, duplicates, invalid, archived, preview}
+    stats = {"added": 0, "duplicates": 0, "invalid": 0, "archived": 0, "preview": None}
+    existing = collections.Counter()
+    loaded = set()
+    archived = get_backend().archived_years()
+    pending, previews = [], []
+    for chunk, fraction in read_statement(file, name, skip_rows, chunk=limit or IMPORT_CHUNK):
+        df, invalid = normalize_statement(chunk, mapping, user, rules)
+        stats["invalid"] += invalid
+        years = set(df['날짜'].dt.year.tolist()) - loaded
+        if years:
+            # 처음 나온 연도는 그 연도 가계부의 해시를 센다 (연도별 저장소면 그 연도만 읽는다)
+            ledger = get_data(years)
+            for year in years:
+                existing.update(dedup_hashes(ledger[partition_mask(ledger, year)]))
+            loaded |= years
+        status = []
+        for h, year in zip(dedup_hashes(df), df['날짜'].dt.year.tolist()):
+            if year in archived:
+                status.append("보관 연도")
+            elif existing[h] > 0:
+                existing[h] -= 1
+                status.append("중복")
+            else:
+                status.append("추가")
+        status = pd.Series(status, index=df.index, dtype=object)
+        stats["duplicates"] += int((status == "중복").sum())
+        stats["archived"] += int((status == "보관 연도").sum())
+        new = df[status == "추가"]
+        stats["added"] += len(new)
+        if not write:
+            previews.append(df.assign(상태=status))
+            break
+        pending += list(zip(new['날짜'].dt.date, new['구분'], new['사용자'], new['카테고리'], new['내역'], new['금액'].tolist()))
+        if len(pending) >= IMPORT_CHUNK:
+            add_rows(pending)
+            pending = []
+        if progress: progress(fraction, stats)
+    if pending: add_rows(pending)
+    if previews: stats["preview"] = pd.concat(previews, ignore_index=True)
+    if progress: progress(1.0, stats)
+    return stats
+
+
+# --- 분석 ---
+# (기간, 카테고리, 사용자, 데이터 버전)별로 필터 결과와 합계/집계를 기억해 둔다 (LRU, ANALYSIS_CACHE_SIZE개)
+# 차트 종류를 바꾸거나 팝업을 열 때는 다시 계산하지 않고 캐시에서 꺼낸다
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_cache():
+    return {"lock": threading.RLock(), "entries": collections.OrderedDict()}
+
+@timed("analyze")
+def analyze(start_date, end_date, categories, users):
+    # 연도별 저장소에서는 기간에 걸친 연도만 읽는다
+    years = range(start_date.year, end_date.year + 1)
+    version = get_data_version(years)
+    key = (start_date, end_date, tuple(sorted(categories)), tuple(sorted(users)), version)
+    cache = get_analysis_cache()
+    with cache["lock"]:
+        if key in cache["entries"]:
+            cache["entries"].move_to_end(key)
+            return cache["entries"][key]
+
+    df = get_data(years)
+    # 행마다 date 객체를 만들지 않고 datetime64 경계값과 바로 비교한다 (끝 날짜는 그 다음 날 0시 미만)
+    start = np.datetime64(start_date, 'ns')
+    end = np.datetime64(end_date, 'ns') + np.timedelta64(1, 'D')
+    dates = df['날짜'].to_numpy()
+    mask = (dates >= start) & (dates < end) & isin_codes(df['카테고리'], categories).to_numpy() & isin_codes(df['사용자'], users).to_numpy()
+    filtered = df.loc[mask]
+    is_exp = filtered['구분'] == '지출'
+    exp_df = filtered[is_exp]
+    result = {
+        "filtered": filtered,
+        "expense": exp_df,
+        "total_inc": int(filtered.loc[filtered['구분'] == '수입', '금액'].sum()),
+        "total_exp": int(exp_df['금액'].sum()),
+        "by_category": exp_df.groupby('카테고리', observed=True)['금액'].sum().reset_index(),
+        "start": start_date, "end": end_date,
+        "series": {},   # (단위, 카테고리별) → expense_series() 결과
+    }
+
+    with cache["lock"]:
+        # 예전 버전 데이터로 만든 결과는 다시 쓸 일이 없으므로 같이 정리한다
+        for old in [k for k in cache["entries"] if k[-1] != version]:
+            del cache["entries"][old]
+        cache["entries"][key] = result
+        while len(cache["entries"]) > ANALYSIS_CACHE_SIZE:
+            cache["entries"].popitem(last=False)
+    return result
+
+# 지출 흐름 차트의 시간 단위. 기간이 길어져도 막대 수가 CHART_MAX_POINTS를 넘지 않도록 단위를 키운다
+BUCKETS = {"일": ("D", 1), "주": ("W-SAT", 7), "월": ("MS", 31)}   # 단위 → (resample 규칙, 대략 일수)
+
+def chart_bucket(start_date, end_date, requested="자동"):
+    # 요청한 단위(자동이면 일)부터 시작해서 점 개수가 CHART_MAX_POINTS 이하가 되는 가장 작은 단위
+    days = (end_date - start_date).days + 1
+    names = list(BUCKETS)
+    for name in names[names.index(requested) if requested in BUCKETS else 0:]:
+        if days / BUCKETS[name][1] <= CHART_MAX_POINTS: return name
+    return names[-1]
+
+def expense_series(analysis, bucket, by_category=False):
+    # 지출을 단위(일/주/월)별로 합친다. 선택한 기간 전체의 빈 구간도 0으로 채우고, 주는 일요일 시작 날짜로 표시한다
+    # 결과는 분석 결과(캐시)에 같이 넣어 두고 다음 실행에서 다시 쓴다
+    key = (bucket, by_category)
+    if key in analysis["series"]: return analysis["series"][key]
+    rule = BUCKETS[bucket][0]
+    exp_df = analysis["expense"]
+    if by_category:
+        series = (exp_df.groupby([pd.Grouper(key='날짜', freq=rule), '카테고리'], observed=True)['금액']
+                  .sum().reset_index())
+        series = series[series['금액'] > 0]
+    else:
+        # 첫/마지막 지출 바깥 구간까지 채우도록 기간 양 끝 날짜로 구간 이름을 만든다 (resample과 같은 규칙)
+        bounds = pd.DatetimeIndex([pd.Timestamp(analysis["start"]), pd.Timestamp(analysis["end"])])
+        labels = pd.Series(0, index=bounds).resample(rule).sum().index
+        series = (exp_df.resample(rule, on='날짜')['금액'].sum()
+                  .reindex(labels, fill_value=0).rename_axis('날짜').reset_index())
+    if bucket == "주":
+        series['날짜'] = series['날짜'] - pd.Timedelta(days=6)
+    analysis["series"][key] = series
+    return series
+
+def cumulative_vs_budget(analysis, bucket, target_budget):
+    # 구간별 누적 지출과 목표 누적 (월 목표를 하루치로 나눠 기간 동안 쌓은 값)
+    series = expense_series(analysis, bucket).copy()
+    series['누적 지출'] = series['금액'].cumsum()
+    # 각 구간이 끝나는 날까지 지난 일수 (마지막 구간은 선택한 끝 날짜까지)
+    start = pd.Timestamp(analysis["start"])
+    ends = (series['날짜'].shift(-1) - pd.Timedelta(days=1)).fillna(pd.Timestamp(analysis["end"]))
+    elapsed = (ends.clip(lower=start) - start).dt.days + 1
+    series['목표 누적'] = (elapsed * target_budget * 12 / 365).round()
+    return series
+
+# --- 추세 리포트 ---
+# 가계부 대신 월별 요약(get_monthly_summary)만 읽어서 월별 추세, 전월/전년 대비, 이동 평균, 예산 달성률을 만든다
+# 몇 년치가 쌓여도 요약은 (월 × 카테고리 × 사용자) 칸 수만큼이라 가계부 전체를 훑는 것보다 훨씬 작다
+
+def get_monthly_summary():
+    # 월별 요약 프레임 (SUMMARY_HEADERS). 내역이 모두 빠진 칸(0)은 뺀다
+    # monthly_summary를 껐으면 지금까지 읽어 둔 연도의 집계 인덱스로 대신한다
+    get_data(())
+    cache = get_frame_cache()
+    with cache["lock"]:
+        # 스냅샷을 보여주는 동안에는 저장소를 읽지 않고 스냅샷의 집계로 대신한다
+        if MONTHLY_SUMMARY and cache["snapshot"] is None:
+            try:
+                monthly = load_monthly(cache)
+            except:
+                reset_connection()
+                monthly = {}
+        else:
+            monthly = cache["index"].by_category
+        rows = [[*key, *values] for key, values in monthly.items() if any(values)]
+    return numeric_frame(rows, SUMMARY_HEADERS, text=('카테고리', '사용자'))
+
+def month_range(end, months):
+    # end가 들어 있는 달까지 months개월 (Period)
+    return pd.period_range(end=pd.Period(end, 'M'), periods=months, freq='M')
+
+def monthly_series(summary, column, categories=None, users=None):
+    # 월(Period)별 합계. column: 지출/수입(또는 건수 컬럼)
+    if categories is not None: summary = summary[summary['카테고리'].isin(categories)]
+    if users is not None: summary = summary[summary['사용자'].isin(users)]
+    sums = summary.groupby(['연도', '월'])[column].sum()
+    months = pd.DataFrame({'year': sums.index.get_level_values(0), 'month': sums.index.get_level_values(1), 'day': 1})
+    return pd.Series(sums.to_numpy(), index=pd.PeriodIndex(pd.to_datetime(months), freq='M'))
+
+def trend_report(summary, column, end, months, categories=None, users=None):
+    # 최근 months개월의 월별 합계, 전월/전년 대비, 3·12개월 이동 평균 (빈 달은 0)
+    # 전년 대비와 12개월 평균을 첫 달부터 채우려고 12개월을 더 만든 뒤 잘라낸다
+    series = monthly_series(summary, column, categories, users).reindex(month_range(end, months + 12), fill_value=0)
+    report = pd.DataFrame({
+        '금액': series,
+        '전월 대비': series.diff(), '전월 대비(%)': series.pct_change() * 100,
+        '전년 대비': series.diff(12), '전년 대비(%)': series.pct_change(12) * 100,
+        '3개월 평균': series.rolling(3).mean(), '12개월 평균': series.rolling(12).mean(),
+    }).replace([np.inf, -np.inf], np.nan).iloc[-months:]
+    report.index = report.index.strftime('%Y-%m')
+    return report.rename_axis('월').reset_index()
+
+def category_changes(summary, column, end, users=None):
+    # 카테고리별 이번 달/전월/전년 동월 합계와 차이
+    if users is not None: summary = summary[summary['사용자'].isin(users)]
+    month = pd.Period(end, 'M')
+    def month_sum(p):
+        return summary[(summary['연도'] == p.year) & (summary['월'] == p.month)].groupby('카테고리')[column].sum()
+    table = pd.DataFrame({'이번 달': month_sum(month), '전월': month_sum(month - 1), '전년 동월': month_sum(month - 12)})
+    table = table.fillna(0).astype('int64')
+    table['전월 대비'] = table['이번 달'] - table['전월']
+    table['전년 대비'] = table['이번 달'] - table['전년 동월']
+    table = table[(table[['이번 달', '전월', '전년 동월']] != 0).any(axis=1)]
+    return table.sort_values('이번 달', ascending=False).rename_axis('카테고리').reset_index()
+
+def budget_report(summary, target_budget, end, months):
+    # 달마다 전체 지출이 목표 생활비 이내였는지 → (월별 표, 달성률)
+    # 달성률은 끝난 달 중 지출이 있었던 달만 센다 (이번 달은 아직 진행 중, 가계부를 쓰기 전 달은 제외)
+    series = monthly_series(summary, '지출').reindex(month_range(end, months), fill_value=0)
+    report = pd.DataFrame({'월': series.index.strftime('%Y-%m'), '지출': series.to_numpy()})
+    report['목표'] = target_budget
+    report['차이'] = report['목표'] - report['지출']
+    report['달성'] = report['지출'] <= target_budget
+    counted = (series.index < pd.Period(datetime.now(), 'M')) & (report['지출'] > 0).to_numpy()
+    rate = report.loc[counted, '달성'].mean() if counted.any() else None
+    return report, rate
 
 
 # --- [NEW] 팝업 기능 정의 ---
 
 @st.dialog("상세 내역 확인")
-def popup_details(df_to_show, title):
+def popup_details(df_to_show, title, totals=None):
+    # totals: 집계 인덱스에서 꺼낸 [지출 합계, 지출 건수, 수입 합계, 수입 건수] (없으면 직접 계산)
     st.markdown(f"#### {title}")
     if not df_to_show.empty:
         show_df = df_to_show[['구분', '금액', '카테고리', '내역', '사용자']].copy()
         st.dataframe(show_df.style.format({"금액": "{:,.0f}원"}), use_container_width=True, hide_index=True)
         
-        exp_sum = df_to_show[df_to_show['구분']=='지출']['금액'].sum()
-        inc_sum = df_to_show[df_to_show['구분']=='수입']['금액'].sum()
+        if totals is not None:
+            exp_sum, inc_sum = totals[0], totals[2]
+        else:
+            exp_sum = df_to_show[df_to_show['구분']=='지출']['금액'].sum()
+            inc_sum = df_to_show[df_to_show['구분']=='수입']['금액'].sum()
         c1, c2 = st.columns(2)
         c1.metric("지출 합계", f"{exp_sum:,.0f}원")
         c2.metric("수입 합계", f"{inc_sum:,.0f}원")
@@ -121,7 +2338,7 @@ def popup_details(df_to_show, title):
 
 # [새로 추가된 기능] 삭제 확인 팝업 (Yes/No)
 @st.dialog("⚠️ 내역 삭제 확인")
-def confirm_delete_dialog(row_idx, item_info):
+def confirm_delete_dialog(row_id, item_info):
     st.error("아래 내역을 정말 삭제하시겠습니까? 삭제 후에는 복구할 수 없습니다.")
     st.markdown(f"> **{item_info}**")
     
@@ -129,16 +2346,530 @@ def confirm_delete_dialog(row_idx, item_info):
     c1, c2 = st.columns(2)
     with c1:
         if st.button("✔️ 네, 삭제합니다", type="primary", use_container_width=True):
-            with st.spinner("삭제 중..."):
-                delete_row(row_idx)
-            st.success("성공적으로 삭제되었습니다!")
-            time.sleep(1)
+            try:
+                with st.spinner("삭제 중..."):
+                    delete_row(row_id)
+            except RowNotFound:
+                # 다른 곳에서 먼저 지운 내역 → 캐시를 버려서 목록에서도 빠지게 한다
+                invalidate_cache()
+                st.warning("이미 삭제된 내역입니다. 목록을 새로 불러옵니다.")
+                return
+            except ValueError as e:
+                st.error(str(e))
+                return
+            flash("성공적으로 삭제되었습니다!")
             st.rerun()
     with c2:
         if st.button("❌ 아니요 (취소)", use_container_width=True):
             st.rerun()
 
 
+# 저장/삭제 후 st.rerun() 하면 메시지가 바로 사라지므로, 다음 실행에서 토스트로 보여준다
+def flash(message):
+    st.session_state["flash"] = message
+
+def show_flash():
+    if "flash" in st.session_state:
+        st.toast(st.session_state.pop("flash"), icon="✅")
+
+def write_queue_status():
+    # 사이드바: 아직 저장되지 않은 쓰기와 실패한 쓰기
+    if not WRITE_BEHIND: return
+    queue = get_write_queue()
+    pending, failed = queue.status()
+    if pending:
+        counts = collections.Counter(pending)
+        st.caption("⏳ 저장 대기: " + ", ".join(f"{WriteQueue.labels[k]} {n}건" for k, n in counts.items()))
+    if failed:
+        st.error(f"저장 실패 {len(failed)}건")
+        for kind, payload, message in failed:
+            st.caption(f"{WriteQueue.labels[kind]} ({len(payload)}건): {message}")
+        r1, r2 = st.columns(2)
+        if r1.button("다시 시도", use_container_width=True, key="retry_writes"):
+            queue.retry_failed()
+            st.rerun()
+        if r2.button("버리기", use_container_width=True, key="discard_writes"):
+            queue.discard_failed()
+            st.rerun()
+
+def format_age(seconds):
+    if seconds < 60: return "방금"
+    if seconds < 3600: return f"{seconds // 60:.0f}분 전"
+    if seconds < 86400: return f"{seconds // 3600:.0f}시간 전"
+    return f"{seconds // 86400:.0f}일 전"
+
+@st.fragment(run_every=2)
+@perf_run("fragment:refresh_watch")
+def refresh_watch():
+    # 백그라운드 새로 읽기가 끝나면 화면 전체를 다시 그린다 (그동안 2초마다 이 조각만 확인)
+    if get_frame_cache()["refresh"] is None:
+        st.rerun()
+    st.caption("🔄 시트에서 최신 내용을 읽는 중...")
+
+def snapshot_status():
+    # 스냅샷/오프라인 안내. 연결이 안 되면 스냅샷 나이와 함께 읽기 전용이라고 알린다
+    cache = get_frame_cache()
+    meta, offline = cache["snapshot"], cache["offline"]
+    if offline is not None:
+        message = f"📴 구글 시트에 연결할 수 없어 **읽기 전용 모드**입니다 ({datetime.fromtimestamp(offline):%H:%M}부터)."
+        if meta is not None:
+            saved = datetime.fromtimestamp(meta["saved_at"]).strftime('%Y-%m-%d %H:%M')
+            message += f" 마지막으로 저장해 둔 스냅샷({saved}, {format_age(time.time() - meta['saved_at'])})을 보여주고 있어 그 뒤의 내역은 빠져 있을 수 있습니다."
+        st.warning(message)
+        if st.button("🔌 다시 연결해 보기", disabled=cache["refresh"] is not None):
+            reconnect()
+            st.rerun()
+    elif meta is not None:
+        st.info(f"⚡ {format_age(time.time() - meta['saved_at'])} 저장해 둔 스냅샷을 먼저 보여주고 있습니다. 다 읽으면 화면이 바뀌며, 그동안 저장은 잠시 기다립니다.")
+    if cache["refresh"] is not None:
+        refresh_watch()
+
+# 표(data_editor)에서 고친 내용을 한 번의 요청으로 저장
+def save_edits(original, edited):
+    changes = diff_frames(original, edited)
+    if not changes:
+        st.info("변경 사항 없음")
+        return
+    try:
+        with st.spinner("저장 중..."):
+            cells, requests = update_cells(changes)
+    except RowNotFound:
+        invalidate_cache()
+        st.warning("이미 삭제된 내역이 있어 저장하지 못했습니다. 목록을 새로 불러왔으니 다시 수정해주세요.")
+        return
+    except ValueError as e:
+        st.error(str(e))
+        return
+    if requests:
+        flash(f"수정 완료! ({cells}칸 저장, API 요청 {requests}회)")
+    else:
+        flash(f"수정 완료! ({cells}칸, 백그라운드에서 저장 중)")
+    st.rerun()
+
+# 내역 표를 페이지 단위로 보여준다. 기간이 아무리 길어도 브라우저로는 현재 페이지만 보낸다
+# data는 인덱스가 ID인 가계부 프레임. (현재 페이지 원본, 표시용 원본, 수정된 표)를 돌려준다
+def transaction_table(data, key):
+    def jump_requested():
+        # 날짜로 이동할 때는 날짜 순 정렬로 바꾸고, 아래에서 해당 페이지를 찾는다
+        st.session_state[f"{key}_sort"] = "날짜"
+        st.session_state[f"{key}_jump_pending"] = True
+
+    c1, c2, c3, c4 = st.columns([1, 1, 1, 1])
+    sort_col = c1.selectbox("정렬 기준", ["날짜", "금액", "카테고리", "사용자"], key=f"{key}_sort")
+    ascending = c2.selectbox("순서", ["내림차순", "오름차순"], key=f"{key}_order") == "오름차순"
+    page_sizes = sorted({20, 50, 100, PAGE_SIZE})
+    page_size = c3.selectbox("페이지당", page_sizes, index=page_sizes.index(PAGE_SIZE), key=f"{key}_size")
+    jump = c4.date_input("날짜로 이동", value=None, key=f"{key}_jump", on_change=jump_requested)
+
+    ordered = data.sort_values(by=sort_col, ascending=ascending, kind="stable")
+    pages = max(1, -(-len(ordered) // page_size))
+    page_key = f"{key}_page"
+    if st.session_state.pop(f"{key}_jump_pending", False) and jump is not None and len(ordered):
+        dates = ordered['날짜'].to_numpy()
+        target = np.datetime64(jump, 'ns')
+        pos = dates.searchsorted(target) if ascending else len(dates) - dates[::-1].searchsorted(target, side='right')
+        st.session_state[page_key] = min(pos, len(ordered) - 1) // page_size + 1
+    st.session_state[page_key] = min(max(st.session_state.get(page_key, 1), 1), pages)
+
+    page = ordered.iloc[(st.session_state[page_key] - 1) * page_size:st.session_state[page_key] * page_size]
+    edit_df = page[['날짜', '구분', '금액', '카테고리', '내역', '사용자']].copy()
+    edit_df['날짜'] = edit_df['날짜'].dt.strftime('%Y-%m-%d')
+    for col in ['구분', '카테고리', '사용자']:
+        edit_df[col] = edit_df[col].astype(str)
+
+    # 행 수가 고정된 표는 같은 key면 아직 저장하지 않은 수정이 "몇 번째 행"에 붙어 남는다
+    # 정렬/페이지 크기/달이 바뀌어 다른 내역이 그 자리에 오면 엉뚱한 내역에 저장되므로 보이는 내역이 바뀌면 key도 바꾼다
+    shown = hashlib.md5("\n".join(map(str, page.index)).encode()).hexdigest()[:12]
+    editor_key = f"{key}_editor_{sort_col}_{ascending}_{page_size}_{shown}"
+
+    # 표에서는 삭제 기능을 끄고 순수하게 내용 '수정'만 하도록 세팅 (체크박스 안나옴)
+    edited = st.data_editor(
+        edit_df,
+        use_container_width=True,
+        height=(len(edit_df) + 1) * 35 + 3,
+        num_rows="fixed",
+        hide_index=True,
+        column_config={
+            "금액": st.column_config.NumberColumn(format="%d원"),
+            "카테고리": st.column_config.SelectboxColumn(options=ALL_CATS),
+            "사용자": st.column_config.SelectboxColumn(options=USERS),
+            "구분": st.column_config.SelectboxColumn(options=["지출", "수입"])
+        },
+        key=editor_key
+    )
+    p1, p2 = st.columns([1, 3])
+    p1.number_input("페이지", min_value=1, max_value=pages, step=1, key=page_key, label_visibility="collapsed")
+    start = (st.session_state[page_key] - 1) * page_size
+    p2.caption(f"{pages}페이지 중 {st.session_state[page_key]}페이지 · 총 {len(ordered):,}건 중 {start + 1:,}–{start + len(page):,}번째")
+    return page, edit_df, edited
+
+
+# --- 화면 조각(fragment) ---
+# 탭 안에서 버튼/표/차트를 만지면 st.fragment로 감싼 부분만 다시 실행된다 (로그인, 사이드바, 데이터 로드는 건너뜀)
+# 데이터는 프로세스 캐시(get_data)에서 다시 꺼내 쓰고, 저장/삭제처럼 쓰기가 있을 때만 st.rerun()으로 전체를 다시 그린다
+
+def shift_home_month(step):
+    # 홈 화면의 달을 step만큼 옮긴다 (해가 바뀌면 연도도 같이)
+    month = st.session_state.home_month + step
+    st.session_state.home_year += (month - 1) // 12
+    st.session_state.home_month = (month - 1) % 12 + 1
+
+@st.fragment
+@perf_run("fragment:delete_picker")
+def delete_picker(page_df, key):
+    # 현재 페이지에 있는 내역을 보기 쉽게 텍스트로 만들어서 딕셔너리에 저장 (ID → 설명)
+    options = {}
+    for row_id, row in page_df.iterrows():
+        options[row_id] = f"{row['날짜'].strftime('%m-%d')} | {row['구분']} | {row['카테고리']} | {row['내역']} | {row['금액']:,}원"
+
+    del_col1, del_col2 = st.columns([3, 1])
+    with del_col1:
+        selected = st.selectbox("삭제할 항목을 선택하세요", list(options.keys()), format_func=options.get, label_visibility="collapsed", key=f"{key}_del_box")
+    with del_col2:
+        if st.button("삭제", use_container_width=True, key=f"btn_del_{key}"):
+            # 팝업 호출
+            confirm_delete_dialog(selected, options[selected])
+
+@st.fragment
+@perf_run("fragment:home")
+@timed("fragment:home")
+def home_panel(today, target_budget):
+    nav1, nav2, nav3 = st.columns([1, 2, 1])
+    nav1.button("◀ 이전 달", use_container_width=True, on_click=shift_home_month, args=(-1,))
+    nav3.button("다음 달 ▶", use_container_width=True, on_click=shift_home_month, args=(1,))
+    year, month = st.session_state.home_year, st.session_state.home_month
+    nav2.markdown(f"<h3 style='text-align: center;'>{year}년 {month}월 내역</h3>", unsafe_allow_html=True)
+
+    df = get_data([year])
+    agg_index = get_index()
+    if not df.empty:
+        this_month_df = month_frame(df, year, month)
+    else:
+        this_month_df = pd.DataFrame(columns=HEADERS)
+    total_expense = agg_index.month_totals(year, month)[0]
+
+    if target_budget > 0:
+        percent = min(total_expense / target_budget, 1.0)
+        st.markdown(f"**목표 달성률 ({percent*100:.1f}%)**")
+        st.progress(percent)
+        st.caption(f"목표 {target_budget:,.0f}원 중 **{total_expense:,.0f}원** 사용")
+
+    st.divider()
+    col1, col2 = st.columns([1, 2])
+
+    with col1:
+        st.subheader("✍️ 내역 입력")
+        exp_type = st.radio("구분", ["지출", "수입"], horizontal=True, key="main_radio")
+
+        cat_options = INCOME_CATS if exp_type == "수입" else EXPENSE_CATS
+
+        with st.form("input_form", clear_on_submit=True):
+            date = st.date_input("날짜", today)
+            user = st.selectbox("사용자", USERS)
+            category = st.selectbox("카테고리", cat_options)
+            item = st.text_input("내용")
+            amount = st.number_input("금액", min_value=0, step=1000)
+
+            if st.form_submit_button("저장하기"):
+                try:
+                    add_row(date, exp_type, user, category, item, amount)
+                    flash("저장되었습니다!")
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+
+    with col2:
+        st.subheader(f"📋 {month}월 전체 내역 ({len(this_month_df)}건)")
+
+        button_placeholder = st.empty()
+
+        if not this_month_df.empty:
+            page_df, edit_df, edited_data = transaction_table(this_month_df.set_index('ID'), "home")
+
+            with button_placeholder:
+                if st.button("💾 수정사항 저장하기 (홈)", type="primary", use_container_width=True, key="save_home"):
+                    save_edits(edit_df, edited_data)
+
+            st.divider()
+            # [NEW] 직관적인 모바일 삭제 UI (드롭다운 + 삭제 버튼)
+            st.markdown("##### 🗑️ 개별 내역 삭제하기")
+            delete_picker(page_df, "home")
+
+        else:
+            st.info("해당 월의 데이터가 없습니다.")
+
+def short_won(value):
+    # 달력 칸에 들어갈 짧은 금액 (12,000 → 1.2만, 3,500,000 → 350만)
+    if value < 10000: return f"{value:,.0f}"
+    return f"{value / 10000:,.1f}".rstrip("0").rstrip(".") + "만"
+
+def calendar_figure(year, month, days, today, intensity=True):
+    # 한 달 달력을 점 하나가 하루인 scatter 한 개로 그린다 (위젯 42개 대신 차트 하나, 데이터가 몇 건이든 점은 최대 31개)
+    # days: [(일, [지출 합계, 지출 건수, 수입 합계, 수입 건수])]
+    import plotly.graph_objects as go
+    calendar.setfirstweekday(calendar.SUNDAY)
+    weeks = calendar.monthcalendar(year, month)
+    position = {day: (i, w) for w, week in enumerate(weeks) for i, day in enumerate(week) if day}
+    labels, hovers, spend = [], [], []
+    for day, (exp, exp_n, inc, inc_n) in days:
+        label = f"<b>{day}</b>"
+        if exp > 0: label += f"<br><span style='color:#c0392b'>-{short_won(exp)}</span>"
+        if inc > 0: label += f"<br><span style='color:#1f6fb2'>+{short_won(inc)}</span>"
+        labels.append(label)
+        hovers.append(f"{month}월 {day}일<br>지출 {exp:,.0f}원 ({exp_n}건)<br>수입 {inc:,.0f}원 ({inc_n}건)")
+        spend.append(exp)
+
+    is_today = [(year, month, day) == (today.year, today.month, today.day) for day, _ in days]
+    fig = go.Figure(go.Scatter(
+        x=[position[day][0] for day, _ in days], y=[position[day][1] for day, _ in days],
+        mode="markers+text", text=labels, textfont=dict(size=11), hovertext=hovers, hoverinfo="text",
+        marker=dict(
+            symbol="square", size=46, opacity=0.9,
+            color=spend if intensity else "#f4f4f4", colorscale="Reds", cmin=0, cmax=max(spend, default=0) or 1,
+            line=dict(width=[2.5 if t else 0.5 for t in is_today], color=["#333" if t else "#ddd" for t in is_today]),
+        ),
+    ))
+    week_korean = ['일', '월', '화', '수', '목', '금', '토']
+    ticks = [f"<span style='color:{'red' if i == 0 else 'blue' if i == 6 else 'black'}'><b>{w}</b></span>" for i, w in enumerate(week_korean)]
+    fig.update_xaxes(range=[-0.5, 6.5], side="top", tickvals=list(range(7)), ticktext=ticks, showgrid=False, zeroline=False, fixedrange=True)
+    fig.update_yaxes(range=[len(weeks) - 0.5, -0.5], visible=False, fixedrange=True)
+    fig.update_layout(height=len(weeks) * 62 + 40, margin=dict(l=0, r=0, t=30, b=0), dragmode=False,
+                      plot_bgcolor="rgba(0,0,0,0)", showlegend=False)
+    return fig
+
+@st.fragment
+@perf_run("fragment:calendar")
+@timed("fragment:calendar")
+def calendar_panel(today):
+    c1, c2, c3 = st.columns([2, 2, 1])
+    sel_year = c1.number_input("연도", value=today.year)
+    sel_month = c2.number_input("월", value=today.month, min_value=1, max_value=12)
+    intensity = c3.toggle("지출 색", value=True, help="지출이 많은 날일수록 진하게 표시합니다.")
+
+    df = get_data([sel_year])
+    days = get_index().month_days(sel_year, sel_month)
+
+    # 선택은 위젯 상태로 남으므로, 팝업을 연 뒤에는 차트 키를 바꿔 선택을 비운다
+    # (다른 조작으로 다시 실행될 때 팝업이 또 뜨지 않고, 같은 날짜를 다시 눌러도 바로 열리도록)
+    key = f"cal_{sel_year}_{sel_month}"
+    generation = st.session_state.get(f"{key}_gen", 0)
+    event = st.plotly_chart(calendar_figure(sel_year, sel_month, days, today, intensity), use_container_width=True,
+                            key=f"{key}_{generation}", on_select="rerun", selection_mode="points", config={"displayModeBar": False})
+
+    picked = event.selection.point_indices if event else []
+    if picked:
+        st.session_state[f"{key}_gen"] = generation + 1
+        day = days[picked[0]][0]
+        # 상세 내역은 클릭한 날짜만 걸러서 보여준다
+        if not df.empty:
+            month_df = month_frame(df, sel_year, sel_month)
+            day_df = month_df[month_df['날짜'].dt.day == day]
+        else:
+            day_df = pd.DataFrame(columns=HEADERS)
+        popup_details(day_df, f"📅 {sel_year}년 {sel_month}월 {day}일 상세 내역", days[picked[0]][1])
+
+@st.fragment
+@perf_run("fragment:chart")
+@timed("fragment:chart")
+def analysis_chart(analysis, target_budget):
+    # plotly.express는 분석 탭에서만 쓰므로 차트를 처음 그릴 때 불러온다
+    import plotly.express as px
+    exp_df = analysis["expense"]
+    charts = ["카테고리별 비중 (원형)", "기간별 지출 흐름 (막대)", "카테고리별 쌓은 막대"]
+    if target_budget > 0: charts.append("누적 지출 vs 목표")
+    chart_type = st.radio(
+        "보고 싶은 차트를 선택하세요",
+        charts,
+        horizontal=True
+    )
+
+    if chart_type == "카테고리별 비중 (원형)":
+        cat_sum = analysis["by_category"]
+        with timed("chart"):
+            fig = px.pie(cat_sum, values='금액', names='카테고리', hole=0.4)
+            fig.update_traces(
+                textposition='inside',
+                textinfo='percent+label',
+                hovertemplate='%{label}<br>%{value:,.0f}원 (%{percent})'
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        st.markdown("#### 🔍 특정 카테고리 세부내역 보기")
+        p_col1, p_col2 = st.columns([3, 1])
+        with p_col1:
+            pop_cat = st.selectbox("항목을 선택하세요", list(exp_df['카테고리'].unique()), label_visibility="collapsed")
+        with p_col2:
+            if st.button("팝업 열기", type="primary", use_container_width=True):
+                cat_df = exp_df[exp_df['카테고리'] == pop_cat]
+                popup_details(cat_df, f"📊 [{pop_cat}] 상세 내역")
+
+    else:
+        b1, b2 = st.columns([3, 2])
+        requested = b1.radio("단위", ["자동", *BUCKETS], horizontal=True, key="chart_bucket")
+        bucket = chart_bucket(analysis["start"], analysis["end"], requested)
+        span = (analysis["end"] - analysis["start"]).days + 1
+        if requested == "자동":
+            b2.caption(f"기간 {span:,}일 → {bucket} 단위")
+        elif bucket != requested:
+            b2.caption(f"기간 {span:,}일은 {requested} 단위로 그리기엔 길어서 {bucket} 단위로 그렸습니다.")
+
+        with timed("chart"):
+            if chart_type == "기간별 지출 흐름 (막대)":
+                series = expense_series(analysis, bucket)
+                fig = px.bar(series, x='날짜', y='금액')
+                fig.update_traces(
+                    texttemplate='%{y:,.0f}원' if len(series) <= 31 else None,
+                    textposition='outside',
+                    hovertemplate='%{x}<br>%{y:,.0f}원'
+                )
+            elif chart_type == "카테고리별 쌓은 막대":
+                series = expense_series(analysis, bucket, by_category=True)
+                fig = px.bar(series, x='날짜', y='금액', color='카테고리')
+                fig.update_traces(hovertemplate='%{x}<br>%{y:,.0f}원')
+            else:
+                series = cumulative_vs_budget(analysis, bucket, target_budget)
+                fig = px.line(series, x='날짜', y=['누적 지출', '목표 누적'], markers=len(series) <= 31)
+                fig.update_traces(hovertemplate='%{x}<br>%{y:,.0f}원')
+                fig.update_layout(legend_title_text="")
+            if bucket != "일":
+                fig.update_xaxes(title=f"날짜 ({bucket} 단위)")
+            fig.update_yaxes(tickformat=",.0f", title="금액 (원)")
+            st.plotly_chart(fig, use_container_width=True)
+
+@st.fragment
+@perf_run("fragment:report")
+@timed("fragment:report")
+def report_panel(today, target_budget):
+    import plotly.express as px
+    summary = get_monthly_summary()
+    if summary.empty:
+        st.warning("데이터가 없습니다.")
+        return
+
+    with st.expander("🔎 조건", expanded=True):
+        c1, c2, c3 = st.columns(3)
+        months = c1.selectbox("기간", [12, 24, 36, 60], format_func=lambda n: f"최근 {n}개월", key="report_months")
+        type_ = c2.radio("구분", TYPES, horizontal=True, key="report_type")
+        all_users = list(dict.fromkeys(USERS + summary['사용자'].unique().tolist()))
+        users = c3.multiselect("사용자", all_users, default=all_users, key="report_users")
+        base_cats = INCOME_CATS if type_ == "수입" else EXPENSE_CATS
+        all_cats = list(dict.fromkeys(base_cats + summary.loc[summary[type_] > 0, '카테고리'].unique().tolist()))
+        cats = st.multiselect("카테고리", all_cats, default=all_cats, key=f"report_cats_{type_}")
+
+    trend = trend_report(summary, type_, today, months, cats, users)
+    last = trend.iloc[-1]
+    delta_color = "inverse" if type_ == "지출" else "normal"
+    def won_delta(value, label):
+        return None if pd.isna(value) else f"{value:+,.0f}원 ({label})"
+    m1, m2, m3 = st.columns(3)
+    m1.metric(f"{last['월']} {type_} (진행 중)", f"{last['금액']:,.0f}원", won_delta(last['전월 대비'], "전월"), delta_color=delta_color)
+    m2.metric("전년 동월", f"{last['금액'] - (last['전년 대비'] or 0):,.0f}원", won_delta(last['전년 대비'], "전년"), delta_color=delta_color)
+    m3.metric("12개월 평균", f"{last['12개월 평균']:,.0f}원")
+
+    with timed("chart"):
+        fig = px.line(trend, x='월', y=['금액', '3개월 평균', '12개월 평균'], markers=True)
+        fig.update_traces(hovertemplate='%{x}<br>%{y:,.0f}원')
+        fig.update_yaxes(tickformat=",.0f", title="금액 (원)")
+        fig.update_layout(legend_title_text="")
+        st.plotly_chart(fig, use_container_width=True)
+
+    with st.expander("📋 월별 표"):
+        st.dataframe(trend.style.format({
+            '금액': "{:,.0f}원", '전월 대비': "{:+,.0f}원", '전년 대비': "{:+,.0f}원",
+            '전월 대비(%)': "{:+.1f}%", '전년 대비(%)': "{:+.1f}%", '3개월 평균': "{:,.0f}원", '12개월 평균': "{:,.0f}원",
+        }, na_rep="-"), use_container_width=True, hide_index=True)
+
+    st.subheader(f"🗂️ 카테고리별 ({last['월']})")
+    changes = category_changes(summary, type_, today, users)
+    if changes.empty:
+        st.info("이번 달과 전월, 전년 동월에 내역이 없습니다.")
+    else:
+        st.dataframe(changes.style.format({col: "{:,.0f}원" for col in ['이번 달', '전월', '전년 동월']} |
+                                          {col: "{:+,.0f}원" for col in ['전월 대비', '전년 대비']}),
+                     use_container_width=True, hide_index=True)
+
+    if type_ == "지출" and target_budget > 0:
+        st.subheader("🎯 목표 생활비 달성률")
+        budget, rate = budget_report(summary, target_budget, today, months)
+        st.metric(f"최근 {months}개월 중 목표 이내로 쓴 달", "-" if rate is None else f"{rate * 100:.0f}%",
+                  help="끝난 달 중 지출이 있었던 달만 셉니다 (사용자/카테고리 조건과 관계없이 전체 지출 기준).")
+        with timed("chart"):
+            fig = px.bar(budget, x='월', y='지출', color=budget['달성'].map({True: "목표 이내", False: "초과"}),
+                         color_discrete_map={"목표 이내": "#2e86de", "초과": "#e74c3c"})
+            fig.add_hline(y=target_budget, line_dash="dash", annotation_text=f"목표 {target_budget:,.0f}원")
+            fig.update_traces(hovertemplate='%{x}<br>%{y:,.0f}원')
+            fig.update_yaxes(tickformat=",.0f", title="지출 (원)")
+            fig.update_layout(legend_title_text="")
+            st.plotly_chart(fig, use_container_width=True)
+
+    if get_backend().partitioned:
+        st.caption("연도별 저장소에서는 한 번이라도 읽은 연도만 요약에 들어 있습니다 (보관된 연도는 보관 요약으로 채움).")
+        if st.button("📚 모든 연도를 읽어서 요약 맞추기"):
+            with st.spinner("모든 연도를 읽는 중..."):
+                get_data(None)
+            st.rerun()
+
+@st.fragment
+@perf_run("fragment:analysis")
+@timed("fragment:analysis")
+def analysis_panel(today, target_budget):
+    df = get_data([today.year])
+    if df.empty:
+        st.warning("데이터가 없습니다.")
+        return
+
+    with st.expander("🔎 검색 조건", expanded=True):
+        col_f1, col_f2 = st.columns(2)
+        with col_f1:
+            default_start = today.replace(day=1)
+            date_range = st.date_input("기간", (default_start, today))
+        with col_f2:
+            all_users = list(df['사용자'].unique())
+            all_cats = ALL_CATS
+            selected_cats = st.multiselect("카테고리", all_cats, default=all_cats)
+            selected_users = st.multiselect("사용자", all_users, default=all_users)
+
+    if len(date_range) != 2:
+        st.info("기간을 선택해주세요.")
+        return
+
+    start_date, end_date = date_range
+    analysis = analyze(start_date, end_date, selected_cats, selected_users)
+    filtered_df = analysis["filtered"]
+    if filtered_df.empty:
+        st.info("내역이 없습니다.")
+        return
+
+    st.divider()
+    m1, m2 = st.columns(2)
+    m1.metric("선택 기간 수입 합계", f"{analysis['total_inc']:,.0f}원")
+    m2.metric("선택 기간 지출 합계", f"{analysis['total_exp']:,.0f}원")
+
+    st.divider()
+
+    st.subheader("📈 지출 분석 차트")
+    if not analysis["expense"].empty:
+        analysis_chart(analysis, target_budget)
+    else:
+        st.info("선택하신 기간에 지출 내역이 없어 그래프를 그릴 수 없습니다.")
+
+    st.divider()
+
+    st.subheader("📝 상세 내역 수정")
+    anal_button_placeholder = st.empty()
+
+    anal_page, display_filtered, edited_anal = transaction_table(filtered_df.set_index('ID'), "anal")
+
+    with anal_button_placeholder:
+        if st.button("💾 수정사항 저장하기 (분석)", type="primary", use_container_width=True, key="save_anal"):
+            save_edits(display_filtered, edited_anal)
+
+    st.divider()
+    # [NEW] 분석 탭에서도 개별 내역 삭제 지원
+    st.markdown("##### 🗑️ 개별 내역 삭제하기")
+    delete_picker(anal_page, "anal")
+
+
 # --- 로그인 및 화면 꾸미기 ---
 def check_password():
     def password_entered():
@@ -176,11 +2907,16 @@ def check_password():
     return False
 
 # --- 2. 메인 화면 ---
+@perf_run()
 def main():
     st.set_page_config(page_title="우리집 가계부", layout="wide", page_icon="🏡")
 
-    if not check_password():
+    start_warm_up()
+    logged_in = check_password()
+    mark_startup("first_paint")
+    if not logged_in:
         return
+    show_flash()
 
     today = datetime.now()
 
@@ -191,393 +2927,218 @@ def main():
 
     with st.sidebar:
         st.title("🏡 우리집 가계부")
-        menu = st.radio("메뉴 이동", ["📝 입력 및 홈", "🔄 고정 지출 관리", "📅 달력", "📊 분석"])
+        menu = st.radio("메뉴 이동", ["📝 입력 및 홈", "🔄 고정 지출 관리", "📅 달력", "📊 분석", "📈 추세 리포트", "📥 명세서 가져오기"])
         st.markdown("---")
         target_budget = st.number_input("목표 생활비(원)", value=2000000, step=100000, format="%d")
+        if st.button("🔄 시트에서 새로고침", use_container_width=True, disabled=has_pending_writes()):
+            reconnect()
+            st.rerun()
+        write_queue_status()
 
-    df = get_data()
-    if not df.empty:
-        try:
-            if df['금액'].dtype == object:
-                df['금액'] = df['금액'].astype(str).str.replace(',', '').astype(float).astype(int)
-            else:
-                df['금액'] = pd.to_numeric(df['금액'])
-            df['날짜'] = pd.to_datetime(df['날짜'])
-        except:
-            df = pd.DataFrame(columns=HEADERS)
-
-    # ==========================
-    # [탭 1] 입력 및 홈
-    # ==========================
-    if menu == "📝 입력 및 홈":
-        
-        nav1, nav2, nav3 = st.columns([1, 2, 1])
-        with nav1:
-            if st.button("◀ 이전 달", use_container_width=True):
-                st.session_state.home_month -= 1
-                if st.session_state.home_month < 1:
-                    st.session_state.home_month = 12
-                    st.session_state.home_year -= 1
-                st.rerun()
-        with nav2:
-            st.markdown(f"<h3 style='text-align: center;'>{st.session_state.home_year}년 {st.session_state.home_month}월 내역</h3>", unsafe_allow_html=True)
-        with nav3:
-            if st.button("다음 달 ▶", use_container_width=True):
-                st.session_state.home_month += 1
-                if st.session_state.home_month > 12:
-                    st.session_state.home_month = 1
-                    st.session_state.home_year += 1
-                st.rerun()
-
-        if not df.empty:
-            this_month_df = df[(df['날짜'].dt.month == st.session_state.home_month) & (df['날짜'].dt.year == st.session_state.home_year)]
-            total_expense = this_month_df[this_month_df['구분']=='지출']['금액'].sum()
-        else:
-            this_month_df = pd.DataFrame(columns=HEADERS)
-            total_expense = 0
-
-        if target_budget > 0:
-            percent = min(total_expense / target_budget, 1.0)
-            st.markdown(f"**목표 달성률 ({percent*100:.1f}%)**")
-            st.progress(percent)
-            st.caption(f"목표 {target_budget:,.0f}원 중 **{total_expense:,.0f}원** 사용")
+    # 연도별 저장소에서는 지금 보는 달의 연도만 읽는다 (달력/분석 탭은 고른 기간에 맞춰 더 읽는다)
+    # 각 탭의 화면 조각도 같은 캐시를 다시 꺼내 쓰므로 여기서 미리 읽어 두면 사이드바 현황과 맞는다
+    get_data({today.year, st.session_state.home_year})
+    mark_startup("first_data")
+    snapshot_status()
 
-        st.divider()
-        col1, col2 = st.columns([1, 2])
+    with st.sidebar:
+        report = get_load_report()
+        st.caption(f"📦 {report['rows']:,}건 로드 · 메모리 {report['memory'] / 1024 / 1024:.1f}MB")
+        if not report['bad_rows'].empty:
+            with st.expander(f"⚠️ 읽지 못한 행 {len(report['bad_rows'])}건 (날짜/금액 확인 필요)"):
+                st.dataframe(report['bad_rows'], use_container_width=True, hide_index=True)
+        if not report['catalog'].empty:
+            with st.expander(f"📚 연도별 저장 현황 (읽은 연도: {', '.join(map(str, report['years'])) or '없음'})"):
+                st.dataframe(report['catalog'].style.format({"행수": "{:,}", "지출": "{:,.0f}원", "수입": "{:,.0f}원"}),
+                             use_container_width=True, hide_index=True)
+
+    with timed(f"tab:{menu}"):
+        # ==========================
+        # [탭 1] 입력 및 홈
+        # ==========================
+        if menu == "📝 입력 및 홈":
+            home_panel(today, target_budget)
+
+        # ==========================
+        # [탭 2] 고정 지출 관리
+        # ==========================
+        elif menu == "🔄 고정 지출 관리":
+            st.header("🔄 매월 고정 지출/수입 설정")
         
-        with col1:
-            st.subheader("✍️ 내역 입력")
-            exp_type = st.radio("구분", ["지출", "수입"], horizontal=True, key="main_radio")
-            
-            cat_options = INCOME_CATS if exp_type == "수입" else EXPENSE_CATS
-
-            with st.form("input_form", clear_on_submit=True):
-                date = st.date_input("날짜", today)
-                user = st.selectbox("사용자", ["해기", "에디", "같이"])
-                category = st.selectbox("카테고리", cat_options)
-                item = st.text_input("내용")
-                amount = st.number_input("금액", min_value=0, step=1000)
-                
-                if st.form_submit_button("저장하기"):
-                    add_row(date, exp_type, user, category, item, amount)
-                    st.success("저장되었습니다!")
-                    time.sleep(0.5)
-                    st.rerun()
+            fixed_df = get_fixed_data()
 
-        with col2:
-            st.subheader(f"📋 {st.session_state.home_month}월 전체 내역 ({len(this_month_df)}건)")
-            
-            button_placeholder = st.empty()
-            
-            if not this_month_df.empty:
-                edit_df = this_month_df.sort_values(by='날짜', ascending=False).copy()
-                edit_df['날짜'] = edit_df['날짜'].dt.strftime('%Y-%m-%d')
-                edit_df = edit_df[['날짜', '구분', '금액', '카테고리', '내역', '사용자']]
-                all_cats = list(set(INCOME_CATS + EXPENSE_CATS))
-
-                dynamic_height = (len(edit_df) + 1) * 35 + 3
-
-                # 표에서는 삭제 기능을 끄고 순수하게 내용 '수정'만 하도록 세팅 (체크박스 안나옴)
-                edited_data = st.data_editor(
-                    edit_df,
-                    use_container_width=True,
-                    height=dynamic_height,
-                    num_rows="fixed", 
-                    hide_index=True,
-                    column_config={
-                        "금액": st.column_config.NumberColumn(format="%d원"),
-                        "카테고리": st.column_config.SelectboxColumn(options=all_cats),
-                        "사용자": st.column_config.SelectboxColumn(options=["해기", "에디", "같이"]),
-                        "구분": st.column_config.SelectboxColumn(options=["지출", "수입"])
-                    }
-                )
+            with st.expander("➕ 새 고정 항목 추가하기", expanded=True):
+                f_type = st.radio("구분", ["지출", "수입"], horizontal=True, key="fixed_radio")
+                f_cats = INCOME_CATS if f_type == "수입" else EXPENSE_CATS
 
-                with button_placeholder:
-                    if st.button("💾 수정사항 저장하기 (홈)", type="primary", use_container_width=True, key="save_home"):
-                        if not edit_df.equals(edited_data):
-                            with st.spinner("저장 중..."):
-                                for index, row in edited_data.iterrows():
-                                    original_row = edit_df.loc[index]
-                                    for col in HEADERS:
-                                        if str(row[col]) != str(original_row[col]):
-                                            update_cell(index, col, row[col])
-                                st.success("수정 완료!")
-                                time.sleep(1)
-                                st.rerun()
-                        else:
-                            st.info("변경 사항 없음")
+                with st.form("fixed_form", clear_on_submit=True):
+                    c1, c2 = st.columns(2)
+                    day = c1.number_input("매월 며칠?", min_value=1, max_value=31, value=1)
+                    amount = c2.number_input("금액", min_value=0, step=10000)
                 
-                st.divider()
-                # [NEW] 직관적인 모바일 삭제 UI (드롭다운 + 삭제 버튼)
-                st.markdown("##### 🗑️ 개별 내역 삭제하기")
+                    c3, c4 = st.columns(2)
+                    user = c3.selectbox("사용자", USERS)
+                    category = c4.selectbox("카테고리", f_cats)
+                    item = st.text_input("내용 (예: 월세)")
                 
-                # 표에 있는 내역을 보기 쉽게 텍스트로 만들어서 딕셔너리에 저장
-                delete_options = {}
-                for idx, row in this_month_df.sort_values(by='날짜', ascending=False).iterrows():
-                    label = f"{row['날짜'].strftime('%m-%d')} | {row['구분']} | {row['카테고리']} | {row['내역']} | {row['금액']:,}원"
-                    delete_options[label] = idx
-
-                del_col1, del_col2 = st.columns([3, 1])
-                with del_col1:
-                    del_selected = st.selectbox("삭제할 항목을 선택하세요", list(delete_options.keys()), label_visibility="collapsed")
-                with del_col2:
-                    if st.button("삭제", use_container_width=True, key="btn_del_home"):
-                        # 팝업 호출
-                        confirm_delete_dialog(delete_options[del_selected], del_selected)
-
+                    if st.form_submit_button("리스트에 추가"):
+                        try:
+                            add_fixed_row(day, f_type, user, category, item, amount)
+                            flash("추가되었습니다!")
+                            st.rerun()
+                        except ValueError as e:
+                            st.error(str(e))
+
+            st.divider()
+
+            st.subheader("🚀 가계부에 적용하기")
+            if not fixed_df.empty:
+                st.dataframe(fixed_df.drop(columns=['ID'], errors='ignore').style.format({"금액": "{:,.0f}원"}), use_container_width=True)
+
+                # 밀린 달까지 계산만 해서 보여주고, 버튼을 눌렀을 때만 등록한다
+                st.caption(f"아직 등록하지 않은 달 중 오늘까지 일자가 지난 고정 지출을 한 번에 등록합니다 (최대 {FIXED_BACKFILL_MONTHS}개월). "
+                           "서버에서 `python post_fixed.py`를 cron으로 돌리면 매일 자동으로 등록됩니다.")
+                # 읽기 전용일 때는 등록 기록을 읽을 수 없으므로 미리보기도 건너뛴다
+                preview = {"rows": [], "skipped": 0, "errors": []} if is_read_only() else post_fixed_expenses(dry_run=True)
+                for e in preview["errors"]:
+                    st.error(f"에러: {e}")
+                if preview["rows"]:
+                    st.dataframe(pd.DataFrame(preview["rows"], columns=HEADERS[:-1]).style.format({"금액": "{:,.0f}원"}),
+                                 use_container_width=True, hide_index=True)
+                    if st.button(f"📅 밀린 고정 지출 {len(preview['rows'])}건 등록하기", type="primary"):
+                        with st.spinner("등록 중..."):
+                            result = post_fixed_expenses()
+                        for e in result["errors"]:
+                            st.error(f"에러: {e}")
+                        if not result["errors"]:
+                            flash(f"총 {len(result['rows'])}건 등록 완료! (이미 등록된 {result['skipped']}건은 건너뜀)")
+                            st.rerun()
+                elif is_read_only():
+                    st.info("읽기 전용 모드에서는 고정 지출을 등록할 수 없습니다.")
+                else:
+                    st.success("지금 등록할 고정 지출이 없습니다.")
+
+                with st.expander("📅 특정 달에 직접 등록하기"):
+                    a1, a2 = st.columns(2)
+                    apply_year = a1.number_input("적용 연도", value=today.year, step=1, key="apply_year")
+                    apply_month = a2.number_input("적용 월", value=today.month, min_value=1, max_value=12, key="apply_month")
+                    if st.button(f"📅 {apply_year}년 {apply_month}월 내역으로 일괄 등록하기"):
+                        with st.spinner("등록 중..."):
+                            count, skipped, errors = apply_fixed_expenses(int(apply_year), int(apply_month))
+                        for e in errors:
+                            st.error(f"에러: {e}")
+                        if not errors:
+                            flash(f"총 {count}건 등록 완료! (이미 등록된 {skipped}건은 건너뜀)")
+                            st.rerun()
+
+                postings = pd.DataFrame(columns=POSTING_HEADERS) if is_read_only() else get_postings()
+                if not postings.empty:
+                    with st.expander(f"🧾 등록 기록 ({len(postings)}건)"):
+                        names = dict(zip(fixed_df['ID'].astype(str), fixed_df['내역'].astype(str)))
+                        log_df = postings.assign(내역=postings['항목ID'].map(names).fillna("(삭제된 항목)"))
+                        st.dataframe(log_df[['월', '내역', '등록시각', '내역ID']].sort_values('등록시각', ascending=False).head(100),
+                                     use_container_width=True, hide_index=True)
+
+                st.markdown("---")
+                st.subheader("🗑️ 고정 항목 삭제")
+                fixed_options = {row['ID']: f"{idx} | 매월 {row['일자']}일 | {row['구분']} | {row['카테고리']} | {row['내역']} | {row['금액']}원" for idx, row in fixed_df.iterrows()}
+                del_id = st.selectbox("삭제할 항목 (위 표의 왼쪽 숫자)", list(fixed_options.keys()), format_func=fixed_options.get)
+                if st.button("선택한 항목 영구 삭제"):
+                    try:
+                        delete_fixed_row(del_id)
+                        flash("삭제되었습니다.")
+                        st.rerun()
+                    except RowNotFound:
+                        invalidate_cache(ledger=False)
+                        st.warning("이미 삭제된 항목입니다. 목록을 새로 불러옵니다.")
+                    except ValueError as e:
+                        st.error(str(e))
             else:
-                st.info("해당 월의 데이터가 없습니다.")
-
-    # ==========================
-    # [탭 2] 고정 지출 관리
-    # ==========================
-    elif menu == "🔄 고정 지출 관리":
-        st.header("🔄 매월 고정 지출/수입 설정")
-        
-        fixed_df = get_fixed_data()
-
-        with st.expander("➕ 새 고정 항목 추가하기", expanded=True):
-            f_type = st.radio("구분", ["지출", "수입"], horizontal=True, key="fixed_radio")
-            f_cats = INCOME_CATS if f_type == "수입" else EXPENSE_CATS
-
-            with st.form("fixed_form", clear_on_submit=True):
+                st.info("등록된 고정 지출이 없습니다.")
+
+        # ==========================
+        # [탭 3] 달력 (날짜 클릭형 팝업 적용)
+        # ==========================
+        elif menu == "📅 달력":
+            st.header("📅 월별 달력 (날짜를 클릭하세요!)")
+            calendar_panel(today)
+
+            st.divider()
+            st.info("💡 달력의 날짜 칸을 터치하시면 팝업으로 상세 내역을 확인할 수 있습니다.")
+
+        # ==========================
+        # [탭 4] 맞춤형 분석 (차트 팝업 적용)
+        # ==========================
+        elif menu == "📊 분석":
+            st.header("📊 맞춤형 상세 분석")
+            analysis_panel(today, target_budget)
+
+        # ==========================
+        # [탭 5] 추세 리포트 (월별 요약 기반)
+        # ==========================
+        elif menu == "📈 추세 리포트":
+            st.header("📈 월별 추세 리포트")
+            st.caption("월별 요약만 읽어서 여러 해의 흐름을 보여줍니다. 이번 달은 아직 진행 중인 값입니다.")
+            report_panel(today, target_budget)
+
+        # ==========================
+        # [탭 6] 명세서 가져오기
+        # ==========================
+        elif menu == "📥 명세서 가져오기":
+            st.header("📥 카드/은행 명세서 가져오기")
+            st.caption("CSV나 엑셀(xlsx) 명세서를 올리면 가계부에 없는 내역만 한꺼번에 추가합니다.")
+            uploaded = st.file_uploader("명세서 파일", type=["csv", "xlsx"])
+            if uploaded is not None:
                 c1, c2 = st.columns(2)
-                day = c1.number_input("매월 며칠?", min_value=1, max_value=31, value=1)
-                amount = c2.number_input("금액", min_value=0, step=10000)
-                
-                c3, c4 = st.columns(2)
-                user = c3.selectbox("사용자", ["해기", "에디", "같이"])
-                category = c4.selectbox("카테고리", f_cats)
-                item = st.text_input("내용 (예: 월세)")
-                
-                if st.form_submit_button("리스트에 추가"):
-                    add_fixed_row(day, f_type, user, category, item, amount)
-                    st.success("추가되었습니다!")
-                    time.sleep(0.5)
-                    st.rerun()
-
-        st.divider()
-
-        st.subheader("🚀 이번 달 가계부에 적용하기")
-        if not fixed_df.empty:
-            st.dataframe(fixed_df.style.format({"금액": "{:,.0f}원"}), use_container_width=True)
-            
-            if st.button("📅 이번 달 내역으로 일괄 등록하기", type="primary"):
-                count = 0
-                for index, row in fixed_df.iterrows():
-                    try:
-                        target_day = int(row['일자'])
-                        last_day = calendar.monthrange(today.year, today.month)[1]
-                        if target_day > last_day: target_day = last_day
-                        target_date = today.replace(day=target_day).strftime('%Y-%m-%d')
-                        add_row(target_date, row['구분'], row['사용자'], row['카테고리'], row['내역'], row['금액'])
-                        count += 1
-                    except Exception as e:
-                        st.error(f"에러: {e}")
-                st.success(f"총 {count}건 등록 완료!")
-                time.sleep(1)
-                st.rerun()
-            
-            st.markdown("---")
-            st.subheader("🗑️ 고정 항목 삭제")
-            del_idx = st.number_input("삭제할 행 번호 (위 표의 왼쪽 숫자)", min_value=0, step=1)
-            if st.button("선택한 항목 영구 삭제"):
-                delete_fixed_row(del_idx)
-                st.warning("삭제되었습니다.")
-                st.rerun()
-        else:
-            st.info("등록된 고정 지출이 없습니다.")
-
-    # ==========================
-    # [탭 3] 달력 (버튼 클릭형 팝업 적용)
-    # ==========================
-    elif menu == "📅 달력":
-        st.header("📅 월별 달력 (날짜를 클릭하세요!)")
-        c1, c2 = st.columns(2)
-        sel_year = c1.number_input("연도", value=today.year)
-        sel_month = c2.number_input("월", value=today.month, min_value=1, max_value=12)
-        
-        calendar.setfirstweekday(calendar.SUNDAY)
-        cal = calendar.monthcalendar(sel_year, sel_month)
-        week_korean = ['일', '월', '화', '수', '목', '금', '토']
-        
-        st.markdown("<br>", unsafe_allow_html=True)
-        
-        cols = st.columns(7)
-        for i, w in enumerate(week_korean):
-            color = "red" if i == 0 else "blue" if i == 6 else "black"
-            cols[i].markdown(f"<div style='text-align:center; color:{color}; font-weight:bold;'>{w}</div>", unsafe_allow_html=True)
-
-        if not df.empty:
-            month_data = df[(df['날짜'].dt.year == sel_year) & (df['날짜'].dt.month == sel_month)]
-        else:
-            month_data = pd.DataFrame(columns=HEADERS)
-
-        for week in cal:
-            cols = st.columns(7)
-            for i, day in enumerate(week):
-                with cols[i]:
-                    if day != 0:
-                        day_df = month_data[month_data['날짜'].dt.day == day] if not month_data.empty else pd.DataFrame(columns=HEADERS)
-                        exp = day_df[day_df['구분']=='지출']['금액'].sum()
-                        inc = day_df[day_df['구분']=='수입']['금액'].sum()
-                        
-                        btn_label = f"{day}일"
-                        if exp > 0: btn_label += f"\n-{exp:,.0f}"
-                        if inc > 0: btn_label += f"\n+{inc:,.0f}"
-                        
-                        if st.button(btn_label, key=f"cal_{sel_year}_{sel_month}_{day}", use_container_width=True):
-                            popup_details(day_df, f"📅 {sel_year}년 {sel_month}월 {day}일 상세 내역")
+                skip_rows = c1.number_input("컬럼 이름 위에 있는 줄 수 (건너뜀)", min_value=0, value=0, step=1)
+                import_user = c2.selectbox("사용자", USERS, key="import_user")
+                try:
+                    columns = list(next(read_statement(uploaded, uploaded.name, int(skip_rows), chunk=1))[0].columns)
+                except StopIteration:
+                    columns = []
+                    st.warning("파일에 내용이 없습니다.")
+                except Exception as e:
+                    columns = []
+                    st.error(f"파일을 읽을 수 없습니다: {e}")
+
+                if columns:
+                    guessed = guess_columns(columns)
+                    choices = ["(없음)"] + columns
+                    mapping = {}
+                    for col, (field, label) in zip(st.columns(4), [("날짜", "날짜"), ("금액", "금액 (이용/출금)"), ("입금", "입금 (있으면)"), ("내역", "내역/가맹점")]):
+                        picked = col.selectbox(label, choices, index=choices.index(guessed[field]) if guessed[field] else 0, key=f"import_col_{field}")
+                        mapping[field] = None if picked == "(없음)" else picked
+
+                    with st.expander("🏷️ 자동 분류 규칙 (한 줄에 '카테고리: 키워드, 키워드', 위에 있는 규칙이 우선)"):
+                        rules_text = st.text_area("분류 규칙", rules_to_text(get_import_rules()), height=250, label_visibility="collapsed")
+                    rules, rule_errors = parse_rules(rules_text)
+                    for e in rule_errors:
+                        st.warning(e)
+
+                    if not mapping["날짜"] or not mapping["내역"] or not (mapping["금액"] or mapping["입금"]):
+                        st.info("날짜, 금액(또는 입금), 내역 컬럼을 골라주세요.")
                     else:
-                        st.write("") 
-
-        st.divider()
-        st.info("💡 달력의 날짜 칸(버튼)을 직접 터치하시면 팝업으로 상세 내역을 확인할 수 있습니다.")
-
-    # ==========================
-    # [탭 4] 맞춤형 분석 (차트 팝업 적용)
-    # ==========================
-    elif menu == "📊 분석":
-        st.header("📊 맞춤형 상세 분석")
-        
-        if df.empty:
-            st.warning("데이터가 없습니다.")
-        else:
-            with st.expander("🔎 검색 조건", expanded=True):
-                col_f1, col_f2 = st.columns(2)
-                with col_f1:
-                    default_start = today.replace(day=1)
-                    date_range = st.date_input("기간", (default_start, today))
-                with col_f2:
-                    all_users = list(df['사용자'].unique())
-                    all_cats = list(set(INCOME_CATS + EXPENSE_CATS))
-                    selected_cats = st.multiselect("카테고리", all_cats, default=all_cats)
-                    selected_users = st.multiselect("사용자", all_users, default=all_users)
-
-            if len(date_range) == 2:
-                start_date, end_date = date_range
-                mask = (
-                    (df['날짜'].dt.date >= start_date) & 
-                    (df['날짜'].dt.date <= end_date) & 
-                    (df['카테고리'].isin(selected_cats)) &
-                    (df['사용자'].isin(selected_users))
-                )
-                filtered_df = df.loc[mask]
-
-                if not filtered_df.empty:
-                    total_inc = filtered_df[filtered_df['구분']=='수입']['금액'].sum()
-                    total_exp = filtered_df[filtered_df['구분']=='지출']['금액'].sum()
-                    
-                    st.divider()
-                    m1, m2 = st.columns(2)
-                    m1.metric("선택 기간 수입 합계", f"{total_inc:,.0f}원")
-                    m2.metric("선택 기간 지출 합계", f"{total_exp:,.0f}원")
-
-                    st.divider()
-
-                    st.subheader("📈 지출 분석 차트")
-                    exp_df = filtered_df[filtered_df['구분'] == '지출']
-                    
-                    if not exp_df.empty:
-                        chart_type = st.radio(
-                            "보고 싶은 차트를 선택하세요", 
-                            ["카테고리별 비중 (원형)", "일별 지출 흐름 (막대)"], 
-                            horizontal=True
-                        )
-                        
-                        if chart_type == "카테고리별 비중 (원형)":
-                            cat_sum = exp_df.groupby('카테고리')['금액'].sum().reset_index()
-                            fig = px.pie(cat_sum, values='금액', names='카테고리', hole=0.4)
-                            fig.update_traces(
-                                textposition='inside', 
-                                textinfo='percent+label',
-                                hovertemplate='%{label}<br>%{value:,.0f}원 (%{percent})'
-                            )
-                            st.plotly_chart(fig, use_container_width=True)
-                            
-                            st.markdown("#### 🔍 특정 카테고리 세부내역 보기")
-                            p_col1, p_col2 = st.columns([3, 1])
-                            with p_col1:
-                                pop_cat = st.selectbox("항목을 선택하세요", exp_df['카테고리'].unique(), label_visibility="collapsed")
-                            with p_col2:
-                                if st.button("팝업 열기", type="primary", use_container_width=True):
-                                    cat_df = exp_df[exp_df['카테고리'] == pop_cat]
-                                    popup_details(cat_df, f"📊 [{pop_cat}] 상세 내역")
-                            
-                        elif chart_type == "일별 지출 흐름 (막대)":
-                            daily_sum = exp_df.groupby('날짜')['금액'].sum().reset_index()
-                            fig = px.bar(daily_sum, x='날짜', y='금액')
-                            fig.update_traces(
-                                texttemplate='%{y:,.0f}원', 
-                                textposition='outside',
-                                hovertemplate='%{x}<br>%{y:,.0f}원'
-                            )
-                            fig.update_yaxes(tickformat=",.0f", title="금액 (원)")
-                            st.plotly_chart(fig, use_container_width=True)
-                    else:
-                        st.info("선택하신 기간에 지출 내역이 없어 그래프를 그릴 수 없습니다.")
-                    
-                    st.divider()
-
-                    st.subheader("📝 상세 내역 수정")
-                    anal_button_placeholder = st.empty()
-
-                    display_filtered = filtered_df.sort_values(by='날짜', ascending=False).copy()
-                    display_filtered['날짜'] = display_filtered['날짜'].dt.strftime('%Y-%m-%d')
-                    display_filtered = display_filtered[['날짜', '구분', '금액', '카테고리', '내역', '사용자']]
-
-                    anal_height = (len(display_filtered) + 1) * 35 + 3
-
-                    # 분석 탭에서도 체크박스 삭제 기능을 끄고 고정 행으로 설정
-                    edited_anal = st.data_editor(
-                        display_filtered,
-                        use_container_width=True,
-                        height=anal_height,
-                        num_rows="fixed",
-                        hide_index=True,
-                        column_config={
-                            "금액": st.column_config.NumberColumn(format="%d원"),
-                            "카테고리": st.column_config.SelectboxColumn(options=all_cats),
-                            "사용자": st.column_config.SelectboxColumn(options=["해기", "에디", "같이"]),
-                            "구분": st.column_config.SelectboxColumn(options=["지출", "수입"])
-                        }
-                    )
-
-                    with anal_button_placeholder:
-                        if st.button("💾 수정사항 저장하기 (분석)", type="primary", use_container_width=True, key="save_anal"):
-                            if not display_filtered.equals(edited_anal):
-                                with st.spinner("저장 중..."):
-                                    for index, row in edited_anal.iterrows():
-                                        original_row = display_filtered.loc[index]
-                                        for col in HEADERS:
-                                            if str(row[col]) != str(original_row[col]):
-                                                update_cell(index, col, row[col])
-                                    st.success("수정 완료!")
-                                    time.sleep(1)
-                                    st.rerun()
+                        preview = import_statement(uploaded, uploaded.name, mapping, import_user, rules, int(skip_rows), write=False, limit=20)
+                        st.subheader("👀 미리보기 (앞 20줄)")
+                        if preview["preview"] is not None:
+                            st.dataframe(preview["preview"].style.format({"날짜": "{:%Y-%m-%d}", "금액": "{:,.0f}원"}), use_container_width=True, hide_index=True)
+                        if st.button("📥 가져오기", type="primary"):
+                            bar = st.progress(0.0, text="가져오는 중...")
+                            def show_progress(fraction, stats):
+                                bar.progress(min(max(fraction, 0.0), 1.0), text=f"{stats['added']:,}건 추가 · 중복 {stats['duplicates']:,}건 건너뜀")
+                            try:
+                                result = import_statement(uploaded, uploaded.name, mapping, import_user, rules, int(skip_rows), progress=show_progress)
+                            except Exception as e:
+                                st.error(f"가져오는 중 오류가 났습니다: {e}")
                             else:
-                                st.info("변경 사항 없음")
-                                
-                    st.divider()
-                    # [NEW] 분석 탭에서도 개별 내역 삭제 지원
-                    st.markdown("##### 🗑️ 개별 내역 삭제하기")
-                    
-                    anal_del_options = {}
-                    for idx, row in filtered_df.sort_values(by='날짜', ascending=False).iterrows():
-                        label = f"{row['날짜'].strftime('%m-%d')} | {row['구분']} | {row['카테고리']} | {row['내역']} | {row['금액']:,}원"
-                        anal_del_options[label] = idx
-
-                    a_del_col1, a_del_col2 = st.columns([3, 1])
-                    with a_del_col1:
-                        a_del_selected = st.selectbox("삭제할 항목을 선택하세요", list(anal_del_options.keys()), label_visibility="collapsed", key="anal_del_box")
-                    with a_del_col2:
-                        if st.button("삭제", use_container_width=True, key="btn_del_anal"):
-                            confirm_delete_dialog(anal_del_options[a_del_selected], a_del_selected)
+                                message = f"{result['added']:,}건 추가 완료! (중복 {result['duplicates']:,}건, 읽을 수 없는 줄 {result['invalid']:,}건 건너뜀)"
+                                if result['archived']:
+                                    message += f" · 보관된 연도 {result['archived']:,}건 제외"
+                                flash(message)
+                                st.rerun()
 
-                else:
-                    st.info("내역이 없습니다.")
-            else:
-                st.info("기간을 선택해주세요.")
+    with st.sidebar:
+        perf_panel()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,342 @@
+"""오프라인 벤치마크: 구글 계정 없이 가짜 시트(메모리)로 app.py의 주요 경로를 잰다.
+
+    python bench.py                                  # 1천 ~ 50만 행
+    python bench.py --sizes 1000,20000 --latency 50  # API 요청마다 50ms 지연
+    python bench.py --output bench_output.txt
+
+단계마다 걸린 시간(ms)과 가짜 시트에 들어간 API 요청 수를 표로 출력한다.
+"""
+import argparse
+import collections
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, timedelta
+
+import gspread
+
+# streamlit을 `streamlit run` 없이 불러오면 나오는 경고는 숨긴다
+warnings.filterwarnings("ignore")
+import logging
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+import app
+import streamlit as st
+
+
+# --- 가짜 구글 시트 ---
+# app.py가 쓰는 gspread Client/Spreadsheet/Worksheet 메서드만 메모리에서 흉내 낸다
+# 호출마다 latency초를 쉬고 calls에 메서드 이름별 횟수를 센다
+
+def a1_to_rowcol(label):
+    col, row = re.match(r"([A-Z]+)(\d+)", label).groups()
+    index = 0
+    for ch in col:
+        index = index * 26 + ord(ch) - 64
+    return int(row), index
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, rows=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = rows or []
+
+    def call(self, name):
+        self.spreadsheet.client.call(name)
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def row_values(self, row):
+        self.call("row_values")
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self.call("col_values")
+        return [str(r[col - 1]) if col <= len(r) else "" for r in self.rows]
+
+    def get_all_records(self):
+        self.call("get_all_records")
+        if not self.rows: return []
+        headers = self.rows[0]
+        return [dict(zip(headers, list(r) + [""] * (len(headers) - len(r)))) for r in self.rows[1:]]
+
+    def get(self, range_name):
+        # "A{n}:G" 처럼 시작 행부터 끝까지 읽는 형태만 지원
+        self.call("get")
+        start, _ = a1_to_rowcol(range_name.split(":")[0])
+        return [[str(v) for v in r] for r in self.rows[start - 1:]]
+
+    def batch_get(self, ranges):
+        self.call("batch_get")
+        out = []
+        for label in ranges:
+            row, col = a1_to_rowcol(label)
+            values = self.rows[row - 1] if row <= len(self.rows) else []
+            out.append([[str(values[col - 1])]] if col <= len(values) and values[col - 1] != "" else [])
+        return out
+
+    def append_row(self, values, **kwargs):
+        self.call("append_row")
+        self.rows.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        self.call("append_rows")
+        self.rows.extend(list(v) for v in values)
+
+    def insert_row(self, values, index=1, **kwargs):
+        self.call("insert_row")
+        self.rows.insert(index - 1, list(values))
+
+    def delete_rows(self, start, end=None):
+        self.call("delete_rows")
+        del self.rows[start - 1:end or start]
+
+    def set_cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        values = self.rows[row - 1]
+        while len(values) < col:
+            values.append("")
+        values[col - 1] = value
+
+    def update_cell(self, row, col, value):
+        self.call("update_cell")
+        self.set_cell(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self.call("batch_update")
+        for item in data:
+            row, col = a1_to_rowcol(item["range"])
+            for i, values in enumerate(item["values"]):
+                for j, value in enumerate(values):
+                    self.set_cell(row + i, col + j, value)
+
+
+class FakeSpreadsheet:
+    def __init__(self, client):
+        self.client = client
+        self.id = "fake-spreadsheet"
+        self.sheets = [FakeWorksheet(self, "sheet1", 0)]
+
+    @property
+    def sheet1(self):
+        self.client.call("sheet1")
+        return self.sheets[0]
+
+    def worksheet(self, title):
+        self.client.call("worksheet")
+        for sheet in self.sheets:
+            if sheet.title == title: return sheet
+        raise gspread.exceptions.WorksheetNotFound(title)
+
+    def worksheets(self):
+        self.client.call("worksheets")
+        return list(self.sheets)
+
+    def add_worksheet(self, title, rows, cols, **kwargs):
+        self.client.call("add_worksheet")
+        sheet = FakeWorksheet(self, title, len(self.sheets))
+        self.sheets.append(sheet)
+        return sheet
+
+    def batch_update(self, body):
+        # deleteDimension(행 삭제)만 반영하고 나머지 요청(보호 범위 등)은 무시한다
+        self.client.call("spreadsheet.batch_update")
+        for request in body["requests"]:
+            if "deleteDimension" not in request: continue
+            target = request["deleteDimension"]["range"]
+            sheet = next(s for s in self.sheets if s.id == target["sheetId"])
+            del sheet.rows[target["startIndex"]:target["endIndex"]]
+
+
+class FakeClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def call(self, name):
+        # 실제 클라이언트의 응답 훅(perf_response_hook)처럼 앱의 API 요청 수에도 센다
+        self.calls[name] += 1
+        app.count_api()
+        if self.latency: time.sleep(self.latency)
+
+    def open(self, title):
+        self.call("open")
+        return self.spreadsheet
+
+    def open_by_key(self, key):
+        self.call("open_by_key")
+        return self.spreadsheet
+
+
+class FakeCredentials:
+    access_token_expired = False
+
+
+def install(client):
+    # 프로세스 캐시를 모두 비우고 app.py의 연결 캐시에 가짜 클라이언트를 넣는다 (authorize 생략)
+    st.cache_resource.clear()
+    app.get_connection().update(creds=FakeCredentials(), client=client)
+
+
+# --- 가짜 가계부 데이터 ---
+
+def make_ledger(n, years=3, seed=0):
+    # 최근 years년에 걸친 n행 (헤더 포함 시트 행 목록). 지출 80%, 수입 20%
+    rng = random.Random(seed)
+    end = date.today()
+    start = end - timedelta(days=365 * years)
+    span = (end - start).days
+    days = sorted(rng.randrange(span + 1) for _ in range(n))
+    rows = [list(app.HEADERS)]
+    for offset in days:
+        if rng.random() < 0.8:
+            type_, category, amount = "지출", rng.choice(app.EXPENSE_CATS), rng.randint(1, 300) * 100
+        else:
+            type_, category, amount = "수입", rng.choice(app.INCOME_CATS), rng.randint(10, 500) * 10000
+        rows.append([str(start + timedelta(days=offset)), type_, rng.choice(app.USERS), category,
+                     f"내역 {rng.randrange(1000)}", amount, f"id{rng.getrandbits(48):012x}"])
+    return rows
+
+
+def make_fixed(n=20, seed=0):
+    rng = random.Random(seed)
+    rows = [list(app.FIXED_HEADERS)]
+    for i in range(n):
+        rows.append([rng.randint(1, 31), "지출", rng.choice(app.USERS), rng.choice(app.EXPENSE_CATS),
+                     f"고정 {i}", rng.randint(1, 100) * 1000, f"id{rng.getrandbits(48):012x}"])
+    return rows
+
+
+# --- 벤치마크 ---
+
+def measure(client, func):
+    # (결과, 걸린 ms, API 요청 수)
+    before = sum(client.calls.values())
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000, sum(client.calls.values()) - before
+
+
+def run_size(n, latency, fixed_items, seed, partitioned=False):
+    client = FakeClient(latency)
+    client.spreadsheet.sheets[0].rows = make_ledger(n, seed=seed)
+    # 크기마다 빈 스냅샷 폴더에서 시작한다 (이전 크기의 스냅샷으로 시작하지 않도록)
+    app.SNAPSHOT_DIR = tempfile.mkdtemp(prefix="bench-snapshot-")
+    fixed = FakeWorksheet(client.spreadsheet, app.FIXED_SHEET, 1, make_fixed(fixed_items, seed))
+    client.spreadsheet.sheets.append(fixed)
+    app.PARTITION_BY_YEAR = False
+    install(client)
+    if partitioned:
+        # sheet1을 연도별 시트로 옮긴 뒤 연도별 저장소로 다시 시작한다 (옮기는 시간은 재지 않음)
+        app.migrate_to_partitions(log=lambda message: None)
+        app.PARTITION_BY_YEAR = True
+        install(client)
+
+    results = []
+    def step(name, func):
+        result, ms, calls = measure(client, func)
+        results.append((name, ms, calls))
+        return result
+
+    today = date.today()
+    # 앱의 첫 화면처럼 올해만 요청한다 (연도로 나누지 않은 저장소는 전체를 읽는다)
+    df = step("load+normalize", lambda: app.get_data([today.year]))
+
+    def reload():
+        for part in app.get_frame_cache()["parts"].values():
+            part["loaded_at"] = 0.0
+        return app.get_data([today.year])
+    step("reload (incremental)", reload)
+    month_df = step("month filter", lambda: app.month_frame(df, today.year, today.month))
+    step("calendar aggregation", lambda: app.AggregateIndex(df))
+    index = app.get_index()
+    step("calendar lookup (month)", lambda: [index.day_totals(today.year, today.month, d) for d in range(1, 32)])
+    start = today - timedelta(days=365)
+    step("analysis filter", lambda: app.analyze(start, today, app.EXPENSE_CATS, app.USERS))
+    step("analysis filter (cached)", lambda: app.analyze(start, today, app.EXPENSE_CATS, app.USERS))
+
+    def edit_save():
+        # 홈 화면 표의 첫 페이지에서 금액 5칸을 고쳐서 저장
+        page = month_df.set_index('ID').head(app.PAGE_SIZE)
+        original = page[['날짜', '구분', '금액', '카테고리', '내역', '사용자']].copy()
+        edited = original.copy()
+        edited.iloc[:5, edited.columns.get_loc('금액')] += 100
+        return app.update_cells(app.diff_frames(original, edited))
+    step("edit-save (5 cells)", edit_save)
+    if partitioned and not month_df.empty:
+        step("edit-save (move to next year)", lambda: move_year(client, month_df['ID'].iloc[0], f"{today.year + 1}-01-15"))
+    step("fixed-apply", lambda: app.apply_fixed_expenses(today.year, today.month))
+    step("fixed-apply (again, all skipped)", lambda: app.apply_fixed_expenses(today.year, today.month))
+    if app.WRITE_BEHIND:
+        step("write-behind drain", lambda: wait_for_writes())
+
+    step("snapshot save", lambda: app.save_snapshot(app.get_frame_cache(), force=True))
+
+    def snapshot_start():
+        # 새 프로세스처럼 캐시를 비우고 첫 get_data()를 잰다. 스냅샷으로 바로 돌아오고 시트는 백그라운드에서 읽는다
+        install(client)
+        return app.get_data([today.year])
+    step("startup from snapshot", snapshot_start)
+    refresh = app.get_frame_cache()["refresh"]
+    if refresh is not None: refresh.join()
+    shutil.rmtree(app.SNAPSHOT_DIR, ignore_errors=True)
+    return results, len(df)
+
+
+def move_year(client, row_id, new_date):
+    # 날짜를 다른 연도로 바꾼 행은 그 연도 시트에만 새 날짜로 있어야 한다 (원래 시트에서는 빠짐)
+    app.update_cells([(row_id, '날짜', new_date)])
+    wait_for_writes()
+    # 옮기기 전 sheet1은 migrate_to_partitions가 그대로 두므로 연도별 시트만 본다
+    found = [(sheet.title, row[0]) for sheet in client.spreadsheet.sheets if sheet.title.startswith(app.partition_title(""))
+             for row in sheet.rows[1:] if row and row[-1] == row_id]
+    expected = [(app.partition_title(app.year_of(new_date)), new_date)]
+    if found != expected:
+        raise AssertionError(f"연도를 옮긴 행 {row_id}: {found} (기대값 {expected})")
+
+
+def wait_for_writes(timeout=60):
+    deadline = time.monotonic() + timeout
+    while app.has_pending_writes() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="가짜 시트로 app.py 성능 측정")
+    parser.add_argument("--sizes", default="1000,10000,100000,500000", help="가계부 행 수 (쉼표로 구분)")
+    parser.add_argument("--latency", type=float, default=0.0, help="API 요청마다 넣을 지연 (ms)")
+    parser.add_argument("--fixed", type=int, default=20, help="고정 지출 항목 수")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--partitioned", action="store_true", help="연도별 시트로 옮긴 뒤 측정")
+    parser.add_argument("--output", help="결과를 이 파일에도 쓴다")
+    args = parser.parse_args(argv)
+
+    lines = [f"backend=fake-sheets latency={args.latency:g}ms write_behind={app.WRITE_BEHIND} partitioned={args.partitioned}"]
+    print(lines[0], flush=True)
+    for n in [int(s) for s in args.sizes.split(",") if s]:
+        results, parsed = run_size(n, args.latency / 1000, args.fixed, args.seed, args.partitioned)
+        lines.append("")
+        lines.append(f"## {n:,} rows (loaded {parsed:,})")
+        lines.append(f"{'step':<34}{'ms':>12}{'api calls':>12}")
+        for name, ms, calls in results:
+            lines.append(f"{name:<34}{ms:>12,.1f}{calls:>12}")
+        print("\n".join(lines[-len(results) - 3:]), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+"""sheet1 하나에 쌓인 가계부를 연도별 시트(가계부_2025 …)로 나눠 옮긴다.
+
+    python migrate_partitions.py --dry-run   # 옮길 연도와 건수만 출력
+    python migrate_partitions.py
+
+옮긴 뒤에는 설정(환경변수 PARTITION_BY_YEAR 또는 secrets의 partition_by_year)을 켜야 앱이 연도별 시트를 읽는다.
+sheet1은 그대로 남으므로 앱에서 확인한 뒤 직접 비우면 된다.
+"""
+import argparse
+import sys
+
+import app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="가계부 sheet1을 연도별 시트로 나누기")
+    parser.add_argument("--dry-run", action="store_true", help="시트에 쓰지 않고 옮길 내용만 보여준다")
+    args = parser.parse_args(argv)
+    if app.get_spreadsheet() is None:
+        print("구글 시트에 연결할 수 없습니다. 인증 파일(또는 .streamlit/secrets.toml)을 확인하세요.")
+        return 1
+    app.migrate_to_partitions(dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""밀린 고정 지출을 가계부에 등록한다. cron 등에서 하루 한 번 돌리면 앱을 열지 않아도 고정 지출이 들어간다.
+
+    python post_fixed.py                      # 등록
+    python post_fixed.py --dry-run            # 등록할 내역만 출력
+    python post_fixed.py --today 2026-03-01   # 그 날짜 기준으로 계산
+
+crontab 예: 10 6 * * * cd /path/to/my-family-account && python post_fixed.py >> post_fixed.log 2>&1
+
+등록한 (고정 항목, 달)은 고정지출기록 시트(SQLite는 postings 테이블)에 남으므로 여러 번 돌려도 한 번만 등록된다.
+"""
+import argparse
+import sys
+from datetime import date, datetime
+
+import app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="밀린 고정 지출을 가계부에 한 번에 등록")
+    parser.add_argument("--dry-run", action="store_true", help="저장하지 않고 등록할 내역만 보여준다")
+    parser.add_argument("--today", type=date.fromisoformat, help="기준 날짜 (YYYY-MM-DD, 기본값은 오늘)")
+    args = parser.parse_args(argv)
+    # 프로세스가 곧 끝나므로 쓰기 대기열을 쓰지 않고 바로 저장하고, 스냅샷으로 먼저 보여줄 화면도 없다
+    app.WRITE_BEHIND = False
+    app.SNAPSHOT_DIR = ""
+    if app.STORAGE_BACKEND == "sheets" and app.get_spreadsheet() is None:
+        print("구글 시트에 연결할 수 없습니다. 인증 파일(또는 .streamlit/secrets.toml)을 확인하세요.")
+        return 1
+
+    result = app.post_fixed_expenses(today=args.today, dry_run=args.dry_run)
+    stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    label = "예정" if args.dry_run else "등록"
+    for row in result["rows"]:
+        print(f"{label}: {row[0]} | {row[1]} | {row[2]} | {row[3]} | {row[4]} | {row[5]:,}원")
+    for error in result["errors"]:
+        print(f"에러: {error}")
+    action = "등록할 내역" if args.dry_run else "등록"
+    print(f"[{stamp}] {action} {len(result['rows'])}건, 이미 등록돼서 건너뜀 {result['skipped']}건, 에러 {len(result['errors'])}건")
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())